@@ -1 +1,15 @@
-from . import dates, dicts, features, inout, np, paths, strings  # noqa: F401
+from . import (  # noqa: F401
+    backends,
+    cache,
+    dates,
+    dicts,
+    encoders,
+    features,
+    inout,
+    np,
+    online,
+    paths,
+    plan,
+    rolling,
+    strings,
+)
@@ -0,0 +1,77 @@
+"""Registry of interchangeable implementations for the hot loops of doors.
+
+Every kernel has a "numpy" implementation and, when numba is installed, a
+compiled "numba" one. The backend is chosen with the DOORS_BACKEND environment
+variable ("auto", "numpy" or "numba") or with set_backend. "auto" uses numba
+when it can be imported. Compiled kernels are cached on disk by numba, so only
+the first run pays the compilation.
+"""
+
+import os
+
+try:
+    import numba
+except ImportError:  # pragma: no cover - numba is optional
+    numba = None
+
+NUMPY = "numpy"
+NUMBA = "numba"
+AUTO = "auto"
+
+_KERNELS = {}
+_backend = None
+
+
+def register(name, backend=NUMPY):
+    """Decorator, registers func as the `backend` implementation of kernel `name`"""
+
+    def decorator(func):
+        _KERNELS.setdefault(name, {})[backend] = func
+        return func
+
+    return decorator
+
+
+def register_jit(name):
+    """Decorator, registers a numba compatible loop as kernel `name`.
+
+    The plain python function is the numpy fallback, unless one was already
+    registered, and the compiled version (cached on disk) the numba one.
+    """
+
+    def decorator(func):
+        kernels = _KERNELS.setdefault(name, {})
+        kernels.setdefault(NUMPY, func)
+        if numba is not None:
+            kernels[NUMBA] = numba.njit(cache=True)(func)
+        return func
+
+    return decorator
+
+
+def get_kernel(name, backend=None):
+    kernels = _KERNELS[name]
+    backend = get_backend() if backend is None else backend
+    return kernels.get(backend, kernels[NUMPY])
+
+
+def get_backend():
+    if _backend is None:
+        set_backend(os.environ.get("DOORS_BACKEND", AUTO))
+    return _backend
+
+
+def set_backend(backend):
+    global _backend
+    backend = backend.lower()
+    if backend == AUTO:
+        backend = NUMPY if numba is None else NUMBA
+    if backend not in (NUMPY, NUMBA):
+        raise ValueError("backend must be 'auto', 'numpy' or 'numba'")
+    if backend == NUMBA and numba is None:
+        raise ValueError("the numba backend needs numba to be installed")
+    _backend = backend
+
+
+def available_backends():
+    return [NUMPY] if numba is None else [NUMPY, NUMBA]
@@ -0,0 +1,115 @@
+"""On-disk cache of feature outputs for multifeat.generate_features.
+
+Every entry is a float32 .npy block (memory-mapped when loaded) with a .json
+holding its column names. The key is the name of the feature function
+(strings.as_string, partial arguments included) plus either a fingerprint of
+the columns it reads or a data_version given by the user:
+    cache = FeatureCache("/tmp/features", max_bytes=10 * 2**30)
+    feat_df = generate_features(df, features, helpers, cache=cache)
+When the directory grows over max_bytes the least recently used entries go.
+Only the inputs declared with multifeat.declare make the key, the features
+without them are keyed on every column (the dry run of multifeat can't see
+reads through .values or .iloc).
+"""
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+class FeatureCache(object):
+    def __init__(self, path, max_bytes=None, data_version=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.data_version = data_version
+        self._fingerprints = {}
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, name, df, columns):
+        """Key of the feature called name reading columns of df, all of them
+        when columns is empty or None"""
+        if not columns:
+            columns = list(df.columns)
+        if self.data_version is None:
+            fingerprints = [
+                self._fingerprint(df, col) for col in sorted(columns, key=str)
+            ]
+            data = ",".join([self._index_fingerprint(df)] + fingerprints)
+        else:
+            data = str(self.data_version)
+        return hashlib.sha1("{}\0{}".format(name, data).encode()).hexdigest()
+
+    def reset_fingerprints(self):
+        """Fingerprints are computed once per column, until the next reset"""
+        self._fingerprints = {}
+
+    def _index_fingerprint(self, df):
+        if None not in self._fingerprints:
+            hashes = pd.util.hash_pandas_object(df.index).values
+            digest = hashlib.sha1(np.ascontiguousarray(hashes).tobytes())
+            self._fingerprints[None] = digest.hexdigest()
+        return self._fingerprints[None]
+
+    def _fingerprint(self, df, col):
+        if col not in self._fingerprints:
+            values = df[col]
+            hashes = pd.util.hash_pandas_object(values, index=True).values
+            digest = hashlib.sha1(str(values.dtype).encode())
+            digest.update(np.ascontiguousarray(hashes).tobytes())
+            self._fingerprints[col] = digest.hexdigest()
+        return self._fingerprints[col]
+
+    def get(self, key):
+        """[(name, values)] stored under key, or None"""
+        values_path, names_path = self._paths(key)
+        if not (os.path.exists(values_path) and os.path.exists(names_path)):
+            return None
+        with open(names_path) as f:
+            names = json.load(f)
+        values = np.load(values_path, mmap_mode="r")
+        os.utime(values_path)
+        return [(name, values[:, i]) for i, name in enumerate(names)]
+
+    def put(self, key, named_values):
+        values_path, names_path = self._paths(key)
+        names = [name for name, _ in named_values]
+        values = np.column_stack([values for _, values in named_values])
+        # written under a temporary name, so readers never see partial files
+        tmp_path = values_path + ".tmp.npy"
+        np.save(tmp_path, values.astype("float32"))
+        with open(names_path + ".tmp", "w") as f:
+            json.dump(names, f)
+        os.replace(names_path + ".tmp", names_path)
+        os.replace(tmp_path, values_path)
+        if self.max_bytes is not None:
+            self.evict(self.max_bytes)
+
+    def evict(self, max_bytes):
+        """Removes the least recently used entries until the cached blocks take
+        max_bytes at most"""
+        entries = []
+        for filename in os.listdir(self.path):
+            if filename.endswith(".npy") and ".tmp" not in filename:
+                stat = os.stat(os.path.join(self.path, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename[: -len(".npy")]))
+        total = sum(size for _, size, _ in entries)
+        for _, size, key in sorted(entries):
+            if total <= max_bytes:
+                break
+            for path in self._paths(key):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def clear(self):
+        self.evict(0)
+
+    def _paths(self, key):
+        base = os.path.join(self.path, key)
+        return base + ".npy", base + ".json"
+
+    def __repr__(self):
+        return "FeatureCache(path={}, max_bytes={})".format(self.path, self.max_bytes)
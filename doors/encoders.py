@@ -0,0 +1,64 @@
+"""Categorical encoders fitted once on training data and reused at scoring time"""
+
+import numpy as np
+import pandas as pd
+
+from doors import inout
+
+
+class FrequencyEncoder(object):
+    """Count encoding of categorical columns.
+
+    fit learns the count of every value of each column (normalize=True gives
+    frequencies instead). transform maps new batches with one hash lookup per
+    row, values not seen in fit get `unseen`. Example:
+        encoder = FrequencyEncoder(["track", "jockey"]).fit(train_df)
+        encoder.save(path)
+        counts = FrequencyEncoder.load(path).transform(new_df)
+    """
+
+    def __init__(self, columns, normalize=False, unseen=0):
+        self.columns = columns if isinstance(columns, list) else [columns]
+        self.normalize = normalize
+        self.unseen = unseen
+        self.mappings = {}
+
+    def fit(self, df):
+        self.mappings = {}
+        for col in self.columns:
+            codes, uniques = pd.factorize(df[col].values)
+            # nulls get code -1, so they are counted in the first position
+            counts = np.bincount(codes + 1, minlength=len(uniques) + 1)
+            if self.normalize:
+                counts = counts / max(len(df), 1)
+            self.mappings[col] = (pd.Index(uniques), counts[1:], counts[0])
+        return self
+
+    def transform(self, df):
+        """Returns an array with one column per encoded column"""
+        counts_are_ints = not self.normalize and float(self.unseen).is_integer()
+        dtype = np.int64 if counts_are_ints else float
+        result = np.empty((len(df), len(self.columns)), dtype=dtype)
+        for i, col in enumerate(self.columns):
+            uniques, counts, null_count = self.mappings[col]
+            values = df[col].values
+            # unseen values get position -1, the last one
+            positions = uniques.get_indexer(values)
+            result[:, i] = np.r_[counts, self.unseen][positions]
+            result[pd.isnull(values), i] = null_count if null_count else self.unseen
+        return result
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def save(self, path):
+        inout.write_pickle(self, path)
+
+    @staticmethod
+    def load(path):
+        return inout.read_pickle(path)
+
+    def __repr__(self):
+        return "FrequencyEncoder(columns={}, normalize={})".format(
+            self.columns, self.normalize
+        )
@@ -1,62 +1,164 @@
 # pylint: disable=invalid-name
-import copy
 from functools import partial
 
 import numpy as np
 import pandas as pd
+from scipy.signal import lfilter
 
-from doors import np as wnp
+from doors import backends, encoders, np as wnp, rolling
+
+MS_PER_DAY = 24 * 60 * 60 * 1000
+ROLLING_FUNCS = {
+    "sum": rolling.rolling_sum,
+    "mean": rolling.rolling_mean,
+    "median": rolling.rolling_median,
+    "max": rolling.rolling_max,
+    "min": rolling.rolling_min,
+    "std": partial(rolling.rolling_std, ddof=1),
+}
+NS_PER_UNIT = {"D": 24 * 60 * 60 * 1e9, "h": 60 * 60 * 1e9, "m": 60 * 1e9, "s": 1e9}
+
+
+def _get_group_ids(df, groupby):
+    """groupby is either a column name or a prebuilt wnp.GroupIndex"""
+    if isinstance(groupby, wnp.GroupIndex):
+        return groupby
+    return df[groupby].values
+
+
+def _get_group_index(df, groupby):
+    return wnp.as_group_index(_get_group_ids(df, groupby))
+
+
+def _blank_null_keys(result, index):
+    """NaN for the rows with a null key, which pandas groupby leaves out"""
+    result[index.null_keys] = np.nan
+    return result
 
 
 def grouped_lagged_decay(df, groupby, col, fillna=0, decay=1):
     """Grouped lagged decay"""
-    values = wnp.fillna(df[col].values, 0)
-    f = partial(lagged_decay, decay=decay)
-    result = wnp.group_apply(values, df[groupby].values, f)
-    result = wnp.fillna(result, fillna)
+    return grouped_lagged_decays(df, groupby, col, [decay], fillna=fillna)[:, 0]
+
+
+def grouped_lagged_decays(df, groupby, col, decays, fillna=0):
+    """Grouped lagged decay for several decay rates, one column per decay.
+    The data is only grouped and sorted once for all of them."""
+    values = wnp.fillna(df[col].values.astype(float), 0)
+    index = _get_group_index(df, groupby)
+    svalues = index.sort(values)
+    kernel = backends.get_kernel("lagged_decay")
+    result = np.column_stack(
+        [kernel(svalues, index.offsets, np.exp(-decay)) for decay in decays]
+    )
+    result = wnp.fillna(index.unsort(result), fillna)
     return result
 
 
 def lagged_decay(ordered_values, decay=1):
     """lagged decay"""
-    result = np.nan * ordered_values
-    previous_value = np.nan
-    historic_score = np.nan
-    current_score = 0
-    for i, value in enumerate(ordered_values):
-        if i > 0:
-            current_score = previous_value + historic_score * np.exp(-decay)
-            result[i] = current_score
-        previous_value = value
-        historic_score = current_score
+    values = np.asarray(ordered_values, dtype=float)
+    offsets = np.array([0, len(values)])
+    return backends.get_kernel("lagged_decay")(values, offsets, np.exp(-decay))
+
+
+@backends.register_jit("lagged_decay")
+def _lagged_decay_loop(values, offsets, decay_factor):
+    """lagged decay of every group of the sorted values, restarting at offsets"""
+    result = np.empty(len(values))
+    for g in range(len(offsets) - 1):
+        previous_value = np.nan
+        historic_score = np.nan
+        current_score = 0.0
+        for i in range(offsets[g], offsets[g + 1]):
+            if i > offsets[g]:
+                current_score = previous_value + historic_score * decay_factor
+                result[i] = current_score
+            else:
+                result[i] = np.nan
+            previous_value = values[i]
+            historic_score = current_score
+    return result
+
+
+@backends.register("lagged_decay")
+def _lagged_decay_filter(values, offsets, decay_factor):
+    """Closed form of _lagged_decay_loop. The scores before lagging follow the
+    linear filter y[i] = x[i] + decay_factor * y[i - 1], run from a zero state
+    on every group (one call per group size, see wnp.equal_size_group_rows)."""
+    if len(values) == 0 or not np.isfinite(values).all():
+        return _lagged_decay_loop(values, offsets, decay_factor)
+    scores = np.empty(len(values))
+    for rows in wnp.equal_size_group_rows(offsets):
+        scores[rows] = lfilter([1.0], [1.0, -decay_factor], values[rows], axis=1)
+    result = np.empty(len(values))
+    result[1:] = scores[:-1]
+    result[offsets[:-1]] = np.nan
     return result
 
 
 def days_to_first_event(df, groupby, time_col):
     """Calculate days to the first date for each group, in a Time series"""
-    dates = df[time_col].astype("datetime64[ns]").values
-    ids = df[groupby].values
-    result = wnp.group_apply(dates, ids, _time_to_min_date)
-    result = _convert_ns_to_days(result)
-    return result
+    return time_since_first_event(df, groupby, time_col, unit="D", dtype=float)
 
 
-def _time_to_min_date(v):
-    min_date = np.min(v)
-    return v - min_date
+def time_since_first_event(df, groupby, time_col, unit="D", dtype=np.float32):
+    """Time since the earliest time_col of each group, in the given unit
+    ("D", "h", "m" or "s")"""
+    index, times, nats = _get_sorted_times(df, groupby, time_col)
+    first_times = np.minimum.reduceat(
+        np.where(nats, np.iinfo(np.int64).max, times), index.starts
+    )
+    diffs = times - np.repeat(first_times, index.sizes)
+    return _times_to_unit(diffs, nats, index, unit, np.nan, dtype)
+
+
+def time_since_previous_event(
+    df, groupby, time_col, unit="D", fillna=np.nan, dtype=np.float32
+):
+    """Time since the previous row of the same group, fillna for the first row"""
+    index, times, nats = _get_sorted_times(df, groupby, time_col)
+    diffs = np.zeros(len(times), dtype=np.int64)
+    diffs[1:] = times[1:] - times[:-1]
+    missing = nats.copy()
+    missing[1:] |= nats[:-1]
+    missing[index.starts] = True
+    return _times_to_unit(diffs, missing, index, unit, fillna, dtype)
+
+
+def time_until_next_event(
+    df, groupby, time_col, unit="D", fillna=np.nan, dtype=np.float32
+):
+    """Time until the next row of the same group, fillna for the last row"""
+    index, times, nats = _get_sorted_times(df, groupby, time_col)
+    diffs = np.zeros(len(times), dtype=np.int64)
+    diffs[:-1] = times[1:] - times[:-1]
+    missing = nats.copy()
+    missing[:-1] |= nats[1:]
+    missing[index.offsets[1:] - 1] = True
+    return _times_to_unit(diffs, missing, index, unit, fillna, dtype)
+
+
+def _get_sorted_times(df, groupby, time_col):
+    """group index, int64 nanoseconds sorted by group and their NaT flags"""
+    index = _get_group_index(df, groupby)
+    times = index.sort(df[time_col].astype("datetime64[ns]").values)
+    return index, times.astype(np.int64), np.isnat(times)
 
 
-def _convert_ns_to_days(values):
-    return (((values / 1000000000) / 60) / 60) / 24
+def _times_to_unit(sorted_diffs, missing, index, unit, fillna, dtype):
+    if unit not in NS_PER_UNIT:
+        raise ValueError("unit must be one of {}".format(list(NS_PER_UNIT)))
+    result = np.where(missing, fillna, sorted_diffs / NS_PER_UNIT[unit])
+    return index.unsort(result).astype(dtype)
 
 
 def grouped_days_since_result(
     df, groupby, col="win_flag", value=1, fillna=-1, coldate="scheduled_time"
 ):
-    func = partial(days_since_result, value=1)
-    result = wnp.group_apply(
-        df[[col, coldate]].values, df[groupby].values, func, multiarg=True
-    )
+    index = _get_group_index(df, groupby)
+    dates = df[coldate].values.astype("datetime64[ms]")
+    result = _days_since_result(df[col].values, dates, value, index=index)
     result = wnp.fillna(result, fillna)
     return result
 
@@ -73,39 +175,114 @@ def days_since_result(
         dates = dates.astype("datetime64[ms]")
     if isinstance(v, pd.Series):
         v = v.values
-
-    date_of_last_win = copy.deepcopy(dates)
-    win_ix = v >= value
-    date_of_last_win[~win_ix] = np.datetime64("NaT")
-    # just to shift: shove a nat to start, drop the last value
-    date_of_last_win = np.r_[np.datetime64("NaT"), date_of_last_win[:-1]]
-    date_of_last_win = wnp.ffill(date_of_last_win)
-    diffs = (dates - date_of_last_win).astype("timedelta64[D]")
-    nan_ix = wnp.isnull(diffs)
-    diffs = diffs.astype(float)
-    diffs[nan_ix] = np.nan
-    return diffs
+    return _days_since_result(v, dates, value)
+
+
+def _days_since_result(v, dates, value, index=None):
+    """Works on the datetime64[ms] dates as float milliseconds (exact for any
+    realistic date), so the last result date is a plain lag and forward fill,
+    grouped by index when given."""
+    times = dates.astype(np.int64).astype(float)
+    times[np.isnat(dates)] = np.nan
+    result_times = np.where(v >= value, times, np.nan)
+    if index is None:
+        last_result_times = wnp.ffill(wnp.lag(result_times, np.nan))
+    else:
+        last_result_times = wnp.group_lag(result_times, index, np.nan)
+        last_result_times = wnp.ffill(last_result_times, group_ids=index)
+    # floor, like casting timedelta64[ms] to timedelta64[D]
+    return np.floor((times - last_result_times) / MS_PER_DAY)
 
 
-def grouped_ema(df: pd.DataFrame, col: str, n_period: float, groupby: str) -> pd.Series:
+def grouped_ema(
+    df: pd.DataFrame, col: str, n_period: float, groupby: str | wnp.GroupIndex
+) -> pd.Series:
     """
     Calculate EMA for each group
     """
-    func = partial(ema, n_period=n_period)
-    result = df.groupby(groupby)[col].transform(func)
-    return result
+    result = grouped_emas(df, col, [n_period], groupby, dtype=float)
+    return pd.Series(result[:, 0], index=df.index, name=col)
+
+
+def grouped_emas(
+    df: pd.DataFrame,
+    col: str,
+    n_periods: list,
+    groupby: str | wnp.GroupIndex,
+    kind="ema",
+    shift=0,
+    init=0,
+    dtype=np.float32,
+) -> np.ndarray:
+    """
+    EMA (or DEMA with kind="dema") of col for each group and each of the
+    n_periods, as a block with one column per period. The data is grouped and
+    sorted once for all of them. With shift > 0 the values are lagged within the
+    groups and the first rows get init.
+    """
+    if kind not in ("ema", "dema"):
+        raise ValueError("kind must be 'ema' or 'dema'")
+    index = _get_group_index(df, groupby)
+    values = index.sort(df[col].values.astype(float))
+    kernel = backends.get_kernel("ema")
+    result = np.empty((len(values), len(n_periods)))
+    for i, n_period in enumerate(n_periods):
+        alpha = _ema_alpha(n_period)
+        emas = kernel(values, index.offsets, alpha)
+        if kind == "dema":
+            emas = 2 * emas - kernel(emas, index.offsets, alpha)
+        result[:, i] = emas
+    result = index.unsort(result)
+    if shift:
+        result = wnp.group_lag(result, index, init=init, shift=shift)
+    return _blank_null_keys(result, index).astype(dtype)
 
 
 def ema(v: pd.Series, n_period=5):
     """Exponential moving average for a vector"""
+    alpha = _ema_alpha(n_period)
+    vals = v.values.astype(float)
+    offsets = np.array([0, len(vals)])
+    return backends.get_kernel("ema")(vals, offsets, alpha)
+
+
+def _ema_alpha(n_period):
     if n_period < 1:
         raise ValueError("n_period can't be less than 1")
-    alpha = 2.0 / (1 + n_period)
-    result = np.nan * np.zeros(len(v))
-    vals = v.values
-    result[0] = vals[0]
-    for i in range(1, len(v)):
-        result[i] = alpha * vals[i] + (1 - alpha) * result[i - 1]
+    return 2.0 / (1 + n_period)
+
+
+@backends.register_jit("ema")
+def _ema_loop(values, offsets, alpha):
+    """ema of every group of the sorted values, restarting at offsets"""
+    result = np.empty(len(values))
+    for g in range(len(offsets) - 1):
+        start = offsets[g]
+        result[start] = values[start]
+        for i in range(start + 1, offsets[g + 1]):
+            result[i] = alpha * values[i] + (1 - alpha) * result[i - 1]
+    return result
+
+
+@backends.register("ema")
+def _ema_filter(values, offsets, alpha):
+    """Closed form of _ema_loop, the linear filter
+    y[i] = alpha * x[i] + (1 - alpha) * y[i - 1] run on every group (one call
+    per group size, see wnp.equal_size_group_rows) with an initial state
+    making its first output the first value of the group."""
+    if len(values) == 0 or not np.isfinite(values).all():
+        return _ema_loop(values, offsets, alpha)
+    decay_factor = 1 - alpha
+    result = np.empty(len(values))
+    for rows in wnp.equal_size_group_rows(offsets):
+        group_values = values[rows]
+        result[rows] = lfilter(
+            [alpha],
+            [1.0, -decay_factor],
+            group_values,
+            axis=1,
+            zi=decay_factor * group_values[:, :1],
+        )[0]
     return result
 
 
@@ -116,11 +293,17 @@ def lagged_ema(v, n_period, shift=1, init=0):
 
 
 def grouped_lagged_ema(
-    df: pd.DataFrame, col: str, n_period: float, groupby: str, shift=1, init=0
+    df: pd.DataFrame,
+    col: str,
+    n_period: float,
+    groupby: str | wnp.GroupIndex,
+    shift=1,
+    init=0,
 ) -> pd.Series:
-    func = partial(lagged_ema, n_period=n_period, shift=shift, init=init)
-    result = df.groupby(groupby)[col].transform(func)
-    return result
+    result = grouped_emas(
+        df, col, [n_period], groupby, shift=shift, init=init, dtype=float
+    )
+    return pd.Series(result[:, 0], index=df.index, name=col)
 
 
 def dema(v: pd.Series, n_period):
@@ -143,33 +326,49 @@ def lagged_dema(v, n_periods):
     return demas
 
 
-def categorical_to_numeric(df, column):
-    """convert text column into numeric using the character codes"""
-
-    def char_to_numeric(char):
-        return str(ord(char))
+def categorical_to_numeric(df, column, max_chars=10):
+    """convert text column into numeric using the character codes.
 
-    def text_to_numeric(text):
-        text = str(text).strip()
-        text = text[:10]
-        text = text.lower()
-        numeric_chars = map(char_to_numeric, text)
-        result = "".join(numeric_chars)
-        result = float(result)
-        return result
-
-    result = map(text_to_numeric, df[column])
-    result = np.log(np.array(result))
-    return result
+    Every value is stripped, truncated to max_chars and lowercased, the decimal
+    codes of its characters are concatenated into a number and the log of that
+    number is returned. Only the unique values are encoded, so the cost scales
+    with the cardinality. A list of columns gives one column per input.
+    """
+    if isinstance(column, list):
+        return np.column_stack(
+            [categorical_to_numeric(df, col, max_chars=max_chars) for col in column]
+        )
+    codes, texts = _factorize_as_text(df[column].values)
+    texts = np.char.strip(texts)
+    texts = np.char.lower(texts.astype("<U{}".format(max_chars)))
+    texts = texts.astype("<U{}".format(max_chars))
+    chars = texts.view(np.uint32).reshape(len(texts), max_chars).astype(float)
+    numbers = np.zeros(len(texts))
+    for char_codes in chars.T:
+        n_digits = np.floor(np.log10(np.maximum(char_codes, 1))) + 1
+        numbers = np.where(
+            char_codes > 0, numbers * 10**n_digits + char_codes, numbers
+        )
+    with np.errstate(divide="ignore"):
+        return np.log(numbers)[codes]
+
+
+def _factorize_as_text(values):
+    """codes and unique str values, with the nulls told apart by their str
+    ("None", "nan", "NaT") as factorize merges them"""
+    codes, uniques = pd.factorize(values)
+    texts = np.asarray(uniques).astype(str)
+    nulls = codes < 0
+    if nulls.any():
+        null_codes, null_texts = pd.factorize(np.asarray(values[nulls]).astype(str))
+        codes[nulls] = len(texts) + null_codes
+        texts = np.concatenate([texts, null_texts.astype(str)])
+    return codes, texts
 
 
 def categorical_to_frequency(df, column):
     """convert categorical column using the frequency of elements"""
-    ixs = wnp.get_group_ixs(df[column].values)
-    res = np.zeros(len(df))
-    for ix in ixs.values():
-        res[ix] = len(ix)
-    return res.astype(np.int64)
+    return encoders.FrequencyEncoder(column).fit_transform(df)[:, 0]
 
 
 def rolling_func(v: pd.Series, window=4, func: str = "sum", fillna=-1) -> pd.Series:
@@ -199,7 +398,7 @@ def lagged_rolling_func(
 
 def grouped_lagged_rolling_func(
     df: pd.DataFrame,
-    groupby: str,
+    groupby: str | wnp.GroupIndex,
     col: str,
     window: str,
     func: str,
@@ -207,7 +406,108 @@ def grouped_lagged_rolling_func(
     shift: int,
 ):
     """Grouped rolling func"""
-    f = partial(
-        lagged_rolling_func, window=window, func=func, fillna=fillna, shift=shift
+    result = grouped_lagged_rolling_funcs(
+        df, groupby, col, [window], [func], fillna=fillna, shift=shift, dtype=float
     )
-    return df.groupby(groupby)[col].transform(f)
+    return result.iloc[:, 0].rename(col)
+
+
+def grouped_lagged_rolling_funcs(
+    df: pd.DataFrame,
+    groupby: str | wnp.GroupIndex,
+    col: str,
+    windows: list,
+    funcs: list,
+    fillna=-1,
+    shift=1,
+    dtype=np.float32,
+) -> pd.DataFrame:
+    """
+    grouped_lagged_rolling_func for every combination of windows and funcs,
+    as a frame with columns named "{col}_{func}_{window}". The data is grouped
+    and sorted once and the rolling kernels run over the whole sorted column:
+    windows starting before their group would need rows of the previous group,
+    and as they are shorter than the window they are blanked like pandas does
+    with min_periods=window.
+    """
+    funcs = [func.lower() for func in funcs]
+    for func in funcs:
+        if func not in ROLLING_FUNCS:
+            raise ValueError("func must be one of {}".format(list(ROLLING_FUNCS)))
+    index = _get_group_index(df, groupby)
+    values = index.sort(df[col].values.astype(float))
+    rows_in_group = np.arange(len(values)) - np.repeat(index.starts, index.sizes)
+    names = []
+    result = np.empty((len(values), len(windows) * len(funcs)))
+    for window in windows:
+        too_short = rows_in_group < window - 1
+        for func in funcs:
+            rolled = ROLLING_FUNCS[func](values, window, min_periods=window)
+            rolled[too_short] = np.nan
+            result[:, len(names)] = rolled
+            names.append("{}_{}_{}".format(col, func, window))
+    result = wnp.fillna(index.unsort(result), fillna)
+    if shift:
+        result = wnp.group_lag(result, index, init=fillna, shift=shift)
+    result = _blank_null_keys(result, index)
+    return pd.DataFrame(result.astype(dtype), index=df.index, columns=names)
+
+
+def grouped_duration_rolling_funcs(
+    df: pd.DataFrame,
+    groupby: str | wnp.GroupIndex,
+    col: str,
+    time_col: str,
+    durations: list,
+    funcs: list,
+    lagged=True,
+    fillna=-1,
+    min_periods=1,
+    dtype=np.float32,
+) -> pd.DataFrame:
+    """
+    Rolling funcs ("sum", "mean", "count" or "max") of col over the rows of each
+    group within the last duration of time (e.g. "30D", anything pd.Timedelta
+    takes), as a frame with columns named "{col}_{func}_{duration}".
+    With lagged=True the window is [t - duration, t) and leaves out every row at
+    the current timestamp, otherwise it is (t - duration, t] up to the current
+    row. Rows are sorted by group and time once and the windows are found with
+    a sweep over the sorted timestamps.
+    """
+    funcs = [func.lower() for func in funcs]
+    for func in funcs:
+        if func not in ("sum", "mean", "count", "max"):
+            raise ValueError("func must be 'sum', 'mean', 'count' or 'max'")
+    index = _get_group_index(df, groupby)
+    times = df[time_col].astype("datetime64[ns]").values.astype(np.int64)
+    order = np.lexsort((times, index.codes))
+    times = times[order]
+    values = df[col].values.astype(float)[order]
+    closed = "left" if lagged else "right"
+    names = []
+    result = np.empty((len(values), len(durations) * len(funcs)))
+    for duration in durations:
+        nanoseconds = pd.Timedelta(duration).value
+        starts, ends = rolling.duration_window_bounds(
+            times, index.offsets, nanoseconds, closed=closed
+        )
+        sums, counts = rolling.window_sums(values, starts, ends)
+        too_few = counts < max(min_periods, 1)
+        for func in funcs:
+            if func == "count":
+                rolled = counts.astype(float)
+            else:
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    if func == "sum":
+                        rolled = sums
+                    elif func == "mean":
+                        rolled = sums / counts
+                    else:
+                        rolled = rolling.window_max(values, starts, ends)
+                rolled = np.where(too_few, np.nan, rolled)
+            result[:, len(names)] = rolled
+            names.append("{}_{}_{}".format(col, func, duration))
+    unsorted = np.empty_like(result)
+    unsorted[order] = result
+    unsorted = wnp.fillna(unsorted, fillna)
+    return pd.DataFrame(unsorted.astype(dtype), index=df.index, columns=names)
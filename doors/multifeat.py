@@ -1,37 +1,130 @@
 import logging
+import queue
 import time
-from multiprocessing import JoinableQueue, Manager, Process
+import traceback
+from collections.abc import Hashable
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import JoinableQueue, Process, Queue, shared_memory
 
 import numpy as np
 import pandas as pd
 
 import doors as wu
+from doors.cache import FeatureCache
 
 FEATURE_PREFIX = "feat:"
 
 
-def generate_features(df, features, helpers, n_jobs=4):
+def generate_features(df, features, helpers, n_jobs=4, backend="process", cache=None):
+    """features is a list of feature functions, doors.plan.FeatureSpec records or
+    both, or a doors.plan.FeaturePlan. With n_jobs > 1 the features run in
+    processes, threads or, with backend="auto", in the backend each feature is
+    annotated with (see declare). cache, a directory or a doors.cache.FeatureCache,
+    stores the outputs and loads them back while the inputs don't change."""
     helpers = [] if helpers is None else helpers
+    features = _compile_specs(features)
+    if backend not in PARALLEL_GENERATORS:
+        raise ValueError("backend must be one of {}".format(list(PARALLEL_GENERATORS)))
     if n_jobs == 1:
         manager = SerialFeatureGenerator()
     else:
-        manager = ParallelFeatureGenerator(n_jobs)
+        manager = PARALLEL_GENERATORS[backend](n_jobs)
+    if cache is not None:
+        manager.cache = (
+            cache if isinstance(cache, FeatureCache) else FeatureCache(cache)
+        )
     feat_df = manager.generate_features(df, features, helpers)
     return feat_df
 
 
+def _compile_specs(features):
+    """The FeatureSpec records are compiled into one plan, which runs as one more
+    feature function so their grouped sorts are shared"""
+    if isinstance(features, wu.plan.FeaturePlan):
+        return [features]
+    specs = [feat for feat in features if isinstance(feat, wu.plan.FeatureSpec)]
+    if not specs:
+        return features
+    funcs = [feat for feat in features if not isinstance(feat, wu.plan.FeatureSpec)]
+    return [wu.plan.FeaturePlan(specs)] + funcs
+
+
+def declare(inputs=None, outputs=None, backend=None):
+    """Decorator declaring the frame columns a feature function reads (helpers
+    and the "feat:" columns of other features included) and the names it
+    returns. Undeclared ones are inferred from a dry run on a sample of the
+    frame. backend ("thread" or "process") is where it runs with
+    generate_features(..., backend="auto"). Also works on partials:
+        declare(inputs=["price"], backend="process")(partial(f, n=3))
+    """
+    if backend not in (None, "thread", "process"):
+        raise ValueError("backend must be 'thread' or 'process'")
+
+    def decorator(func):
+        if inputs is not None:
+            func.inputs = list(inputs)
+        if outputs is not None:
+            func.outputs = list(outputs)
+        if backend is not None:
+            func.backend = backend
+        return func
+
+    return decorator
+
+
+class _RecordingFrame(pd.DataFrame):
+    """Frame that records the columns read with [] or as attributes"""
+
+    _metadata = ["accessed"]
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def __getitem__(self, key):
+        keys = key if isinstance(key, list) else [key]
+        for col in keys:
+            if isinstance(col, Hashable) and col in self.columns:
+                self.accessed[col] = None
+        return super().__getitem__(key)
+
+
+def _topological_levels(dependencies):
+    """dependencies[i] is the set of nodes i depends on. Returns the nodes in
+    levels, each one only depending on the previous levels"""
+    pending = dict(enumerate(dependencies))
+    levels = []
+    done = set()
+    while pending:
+        level = [node for node, deps in pending.items() if deps <= done]
+        if not level:
+            raise ValueError(
+                "features {} depend on each other in a cycle".format(sorted(pending))
+            )
+        for node in level:
+            del pending[node]
+        done.update(level)
+        levels.append(level)
+    return levels
+
+
 class _FeatureGenerator(object):
     feature_prefix = FEATURE_PREFIX
+    dry_run_rows = 1000
+    cache = None
+    _dry_results = {}
 
     def namer(self, func):
         return wu.strings.as_string(func)
 
     def generate_features(self, df, features, helpers):
+        if self.cache is not None:
+            self.cache.reset_fingerprints()
         df = df.copy(deep=False)
         helper_df = self._generate_helpers(df, helpers)
-        df = pd.concat([df, helper_df], axis=1)
+        df = pd.concat([df, helper_df], axis=1, copy=False)
         feat_df = self._generate_features(df, features)
-        feat_df = pd.concat([feat_df, helper_df], axis=1)
+        feat_df = pd.concat([feat_df, helper_df], axis=1, copy=False)
         return feat_df
 
     def _log_func(self, func):
@@ -53,7 +146,7 @@ class _FeatureGenerator(object):
         return values.astype("float32")
 
     def _generate_helpers(self, df, helpers):
-        helper_df = pd.DataFrame()
+        columns = {}
         logger = logging.getLogger(__name__)
         for func in helpers:
             func_name = self.namer(func)
@@ -62,8 +155,175 @@ class _FeatureGenerator(object):
             helpers = self._sanitise(result)
             for values, name in helpers:
                 name = func_name if name is None else name
-                helper_df[name] = values
-        return helper_df
+                columns[name] = values
+        return pd.DataFrame(columns, index=df.index)
+
+    def _named_results(self, func, result):
+        """[(column name, float32 values)] of the result of a feature function"""
+        func_name = self.namer(func)
+        return [
+            (
+                self.feature_prefix + (func_name if name is None else name),
+                self._postprocess_features(values),
+            )
+            for values, name in self._sanitise(result)
+        ]
+
+    def _schedule(self, df, features):
+        """Splits the positions of the features in levels: the features of a
+        level only read the frame and the outputs of the previous levels.
+
+        Returns the levels and the columns read by every feature. Fails fast
+        on missing columns and cycles. Features whose dry run fails are taken
+        to read every column and run last.
+        """
+        self._dry_results = {}
+        columns = set(df.columns)
+        inputs = [getattr(func, "inputs", None) for func in features]
+        if all(cols is not None and set(cols) <= columns for cols in inputs):
+            return [list(range(len(features)))], inputs
+        outputs = [
+            [self.feature_prefix + name for name in func.outputs]
+            if hasattr(func, "outputs")
+            else None
+            for func in features
+        ]
+        failed, blocked = self._dry_run(df, features, inputs, outputs)
+        for position in failed + blocked:
+            outputs[position] = []
+        producers = {}
+        for position, names in enumerate(outputs):
+            for name in names:
+                producers.setdefault(name, position)
+        for position in failed + blocked:
+            inputs[position] = list(df.columns) + list(producers)
+        dependencies = []
+        for position, cols in enumerate(inputs):
+            missing = [col for col in cols if col not in columns | set(producers)]
+            if missing:
+                raise KeyError(
+                    "feature {} reads missing columns {}".format(
+                        self.namer(features[position]), missing
+                    )
+                )
+            deps = {producers[col] for col in cols if col not in columns}
+            if position in blocked:
+                deps.update(failed)
+            dependencies.append(deps - {position})
+        return _topological_levels(dependencies), inputs
+
+    def _dry_run(self, df, features, inputs, outputs):
+        """Fills the unknown inputs and outputs running the features on the
+        first dry_run_rows, in rounds until every feature found its inputs.
+
+        Returns the positions of the features that failed, and of the ones
+        still missing columns after that (they may read the outputs of the
+        failed features). When the sample is the whole frame, without
+        placeholders (they can be read through .values), the results of the
+        features are kept in _dry_results, so they don't run twice.
+        """
+        sample = df.head(self.dry_run_rows).copy()
+        pending = []
+        for position, (cols, names) in enumerate(zip(inputs, outputs)):
+            if cols is None or names is None:
+                pending.append(position)
+        # fully declared features are not run, their outputs are placeholders
+        placeholders = {
+            name: np.zeros(len(sample), dtype="float32")
+            for position, names in enumerate(outputs)
+            if position not in pending
+            for name in names
+        }
+        sample = sample.assign(**placeholders)
+        failed, results = [], {}
+        while pending:
+            blocked = self._dry_run_round(sample, features, pending, failed, results)
+            for position, (accessed, named_results) in results.items():
+                if inputs[position] is None:
+                    inputs[position] = accessed
+                if outputs[position] is None:
+                    outputs[position] = [name for name, _ in named_results]
+            if len(blocked) == len(pending) and failed:
+                return failed, list(blocked)
+            if len(blocked) == len(pending):
+                missing = {
+                    self.namer(features[pos]): key for pos, key in blocked.items()
+                }
+                raise KeyError(
+                    "features read missing columns, or depend on each other in a "
+                    "cycle: {}".format(missing)
+                )
+            pending = list(blocked)
+        if len(sample) == len(df) and not placeholders:
+            self._dry_results = {
+                position: named_results
+                for position, (_, named_results) in results.items()
+            }
+        return failed, []
+
+    def _dry_run_round(self, sample, features, pending, failed, results):
+        """Dry runs the pending features, their outputs are added to sample and
+        their (accessed columns, results) to results, the features raising
+        anything but a KeyError to failed. Returns {position: missing column}
+        of the features that couldn't run"""
+        blocked = {}
+        for position in pending:
+            try:
+                results[position] = self._dry_run_feature(sample, features[position])
+            except KeyError as e:
+                blocked[position] = e.args[0]
+                continue
+            except Exception as e:  # pylint: disable=broad-except
+                logging.getLogger(__name__).warning(
+                    "dry run of {} failed ({!r}), it runs last".format(
+                        self.namer(features[position]), e
+                    )
+                )
+                failed.append(position)
+                continue
+            for name, values in results[position][1]:
+                sample[name] = values
+        return blocked
+
+    def _dry_run_feature(self, sample, func):
+        frame = _RecordingFrame(sample)
+        frame.accessed = {}
+        named_results = self._named_results(func, func(frame))
+        return list(frame.accessed), named_results
+
+    def _load_cached(self, df, features, level, outputs):
+        """Fills outputs with the features of level that are cached or were
+        computed by the dry run. Returns the positions left to compute and the
+        {position: cache key} of the ones to store. Only the declared inputs
+        make the keys, the dry run misses reads through .values or .iloc"""
+        keys = {}
+        for position in level:
+            outputs[position] = self._dry_results.pop(position, None)
+            if self.cache is None:
+                continue
+            func = features[position]
+            key = self.cache.key(self.namer(func), df, getattr(func, "inputs", None))
+            cached = self.cache.get(key)
+            if cached is None:
+                keys[position] = key
+            elif outputs[position] is None:
+                outputs[position] = cached
+        return [position for position in level if outputs[position] is None], keys
+
+    def _store_cached(self, keys, outputs):
+        for position, key in keys.items():
+            self.cache.put(key, outputs[position])
+
+    def _outputs_to_frame(self, index, outputs):
+        """Frame of the [(name, values)] of every feature, in feature order"""
+        columns = [name for named in outputs for name, _ in named]
+        values = np.empty((len(index), len(columns)), dtype="float32", order="F")
+        i = 0
+        for named in outputs:
+            for _, feat_values in named:
+                values[:, i] = feat_values
+                i += 1
+        return pd.DataFrame(values, index=index, columns=columns)
 
     def _sanitise(self, result):
         if isinstance(result, np.ndarray):
@@ -84,95 +344,385 @@ class _FeatureGenerator(object):
         return type(self).__name__
 
 
+class _FeatureBlock(object):
+    """float32 block the features are written into column by column, with room
+    for one column per feature to start with and doubling when it's full.
+    Wrapped into frames without copies."""
+
+    def __init__(self, n_rows, capacity):
+        self.values = np.empty((n_rows, max(capacity, 1)), dtype="float32", order="F")
+        self.names = []
+
+    def append(self, name, values):
+        if len(self.names) == self.values.shape[1]:
+            grown = np.empty(
+                (self.values.shape[0], 2 * self.values.shape[1]),
+                dtype="float32",
+                order="F",
+            )
+            grown[:, : len(self.names)] = self.values
+            self.values = grown
+        self.values[:, len(self.names)] = values
+        self.names.append(name)
+
+    def to_frame(self, index, start=0, order=None):
+        """Frame of the columns from start on, or of the columns in order (a
+        copy, unless order is the block order)"""
+        values = self.values[:, start : len(self.names)]
+        names = self.names[start:]
+        if order is not None and list(order) != list(range(len(self.names))):
+            values = self.values[:, order]
+            names = [self.names[i] for i in order]
+        return pd.DataFrame(values, index=index, columns=names, copy=False)
+
+
 class SeriallyAddFeaturesMixin(object):
     def _generate_features(self, df, features):
-        feat_df = pd.DataFrame()
+        features = list(features)
+        levels, inputs = self._schedule(df, features)
+        block = _FeatureBlock(len(df), len(features))
+        columns = [None] * len(features)
+        outputs = [None] * len(features)
         logger = logging.getLogger(__name__)
-        for func in features:
-            func_name = self.namer(func)
-            logger.debug("Adding features: " + func_name)
-            result = func(df)
-            sanitised_results = self._sanitise(result)
-            # if func_name == 'partial(func=raw_column, column=years_to_foaling_date)':
-            #     import pdb;pdb.set_trace()
-            for value, name in sanitised_results:
-                name = func_name if name is None else name
-                feat_name = "feat:" + name
-                value = self._postprocess_features(value)
-                df[feat_name] = value
-                feat_df[feat_name] = value
-        return feat_df
+        for i, level in enumerate(levels):
+            level_start = len(block.names)
+            _, keys = self._load_cached(df, features, level, outputs)
+            for position in level:
+                if outputs[position] is None:
+                    func = features[position]
+                    logger.debug("Adding features: " + self.namer(func))
+                    outputs[position] = self._named_results(func, func(df))
+                if position in keys:
+                    self._store_cached({position: keys[position]}, outputs)
+                start = len(block.names)
+                for feat_name, value in outputs[position]:
+                    block.append(feat_name, value)
+                columns[position] = range(start, len(block.names))
+                outputs[position] = None
+            if i + 1 < len(levels):
+                # the next levels read the outputs of this one through a view
+                level_df = block.to_frame(df.index, start=level_start)
+                df = pd.concat([df, level_df], axis=1, copy=False)
+        order = [col for position_cols in columns for col in position_cols]
+        return block.to_frame(df.index, order=order)
+
+
+class SharedFrame(object):
+    """The columns of a frame published once in shared memory.
+
+    Pickling a SharedFrame only sends the names of the shared blocks, and
+    attach rebuilds the frame in a worker over read-only views of them.
+    Columns without a plain numpy dtype (objects, categoricals, ...) can't be
+    shared and are pickled with it.
+    """
+
+    def __init__(self, df):
+        self.index = df.index
+        self.columns = []
+        self._blocks = []
+        self._attached = []
+        for name in df.columns:
+            column = df[name]
+            if isinstance(column.dtype, np.dtype) and not column.dtype.hasobject:
+                block, values = _create_shared_array(column.shape, column.dtype)
+                values[:] = column.values
+                self._blocks.append(block)
+                self.columns.append((name, block.name, column.dtype.str))
+            else:
+                self.columns.append((name, None, column.values))
+
+    def __getstate__(self):
+        return {
+            "index": self.index,
+            "columns": self.columns,
+            "_blocks": [],
+            "_attached": [],
+        }
+
+    @property
+    def key(self):
+        return tuple(block_name for _, block_name, _ in self.columns)
+
+    def attach(self):
+        data = {}
+        for name, block_name, values in self.columns:
+            if block_name is not None:
+                block, values = _attach_shared_array(
+                    block_name, (len(self.index),), values, readonly=True
+                )
+                self._attached.append(block)
+            data[name] = values
+        return pd.DataFrame(data, index=self.index, copy=False)
+
+    def close(self):
+        for block in self._attached + self._blocks:
+            block.close()
+        self._attached = []
+        self._blocks = []
+
+    def unlink(self):
+        for block in self._blocks:
+            block.unlink()
+        self.close()
+
+
+def _create_shared_array(shape, dtype, order="C"):
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape)) * dtype.itemsize
+    block = shared_memory.SharedMemory(create=True, size=max(nbytes, 1))
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf, order=order)
+
+
+def _attach_shared_array(name, shape, dtype, readonly=False, order="C"):
+    block = shared_memory.SharedMemory(name=name)
+    values = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf, order=order)
+    if readonly:
+        values.flags.writeable = False
+    return block, values
+
+
+class _ProcessWorkers(object):
+    """n_jobs processes running generator._get_feature.
+
+    The input columns are published once in shared memory (see SharedFrame)
+    and every feature writes its values straight into a preallocated shared
+    float32 block with a column per feature (Fortran ordered, so every column
+    is contiguous), so only names and positions go through the queues. The
+    outputs are views of the block until the result copies them out. Features
+    returning several columns write them into a block of their own.
+    While waiting for results the workers are checked every poll_seconds, so
+    a worker killed mid-feature (out of memory, segfault) raises instead of
+    hanging.
+    """
+
+    poll_seconds = 1.0
+
+    def __init__(self, generator, df, n_features, n_jobs):
+        self.generator = generator
+        self.index = df.index
+        self.frame = SharedFrame(df)
+        self.block, self.output = _create_shared_array(
+            (len(df), n_features), "float32", order="F"
+        )
+        self.tasks, self.results = JoinableQueue(), Queue()
+        self.extras = []
+        output_spec = (self.block.name, self.output.shape)
+        self.processes = [
+            Process(
+                target=generator._get_feature,
+                args=(self.frame, output_spec, self.tasks, self.results, i),
+            )
+            for i in range(n_jobs)
+        ]
+        for proc in self.processes:
+            proc.start()
+
+    def submit(self, features, level):
+        for position in level:
+            self.tasks.put((position, features[position], self.extras))
+
+    def collect(self, features, level, outputs):
+        """Waits for the features of a level, outputs[position] gets their
+        [(name, values)]"""
+        for _ in level:
+            position, names, extra_spec, error = self._next_result()
+            if error is not None:
+                raise RuntimeError(
+                    "feature {} failed:\n{}".format(
+                        self.generator.namer(features[position]), error
+                    )
+                )
+            if extra_spec is None:
+                # no local name holds the view, a traceback must not keep it
+                outputs[position] = [(names[0], self.output[:, position])]
+                continue
+            extra, shared = _attach_shared_array(*extra_spec, order="F")
+            values = shared.copy(order="F")
+            del shared
+            extra.close()
+            extra.unlink()
+            outputs[position] = [(name, values[:, i]) for i, name in enumerate(names)]
+
+    def _next_result(self):
+        while True:
+            try:
+                return self.results.get(timeout=self.poll_seconds)
+            except queue.Empty:
+                for proc in self.processes:
+                    if proc.exitcode is not None:
+                        raise RuntimeError(
+                            "feature worker {} died with exit code {}".format(
+                                proc.name, proc.exitcode
+                            )
+                        )
+
+    def publish(self, level, next_levels, inputs, outputs):
+        """Shares the outputs of level read by the next levels"""
+        needed = {col for later in next_levels for pos in later for col in inputs[pos]}
+        columns = {
+            name: values
+            for position in level
+            for name, values in outputs[position]
+            if name in needed
+        }
+        if columns:
+            frame = SharedFrame(pd.DataFrame(columns, index=self.index))
+            self.extras = self.extras + [frame]
+
+    def stop(self, terminate=False):
+        """Waits for the workers to finish, or kills them with terminate=True
+        (after a failure, when a dead worker may hold the queue locks), and
+        releases the shared memory"""
+        for proc in self.processes:
+            if terminate:
+                proc.terminate()
+            else:
+                self.tasks.put(None)
+        for proc in self.processes:
+            proc.join()
+        del self.output
+        self.block.close()
+        self.block.unlink()
+        for frame in [self.frame] + self.extras:
+            frame.unlink()
 
 
 class ParallelAddFeaturesMixin(object):
+    """Computes the features level by level (see _FeatureGenerator._schedule)
+    in n_jobs worker processes, see _ProcessWorkers.
+
+    With backend "thread" they run in a pool of n_jobs threads instead, which
+    share the frame without any copy and only pays off for features releasing
+    the GIL (most numpy and pandas code). With "auto" each feature runs in
+    the backend named by its `backend` annotation (see declare), threads when
+    it has none.
+    """
+
+    backend = "process"
+
     def __init__(self, n_jobs):
         self.n_jobs = n_jobs
-        self._queue = JoinableQueue()
         self._logger = logging.getLogger(__name__)
 
+    def _feature_backend(self, func):
+        if self.backend == "auto":
+            return getattr(func, "backend", "thread")
+        return self.backend
+
     def _generate_features(self, df, features):
-        map(self._queue.put, features)
-        self._set_processes(df)
-        self._start_processes()
-        self._terminate()
-        feat_df = pd.DataFrame(self.return_dict)
+        features = list(features)
+        levels, inputs = self._schedule(df, features)
+        in_processes = {
+            position
+            for position, func in enumerate(features)
+            if self._feature_backend(func) == "process"
+        }
+        outputs = [None] * len(features)
+        workers = None
+        if in_processes:
+            workers = _ProcessWorkers(self, df, len(features), self.n_jobs)
+        completed = False
+        try:
+            with ThreadPoolExecutor(max_workers=self.n_jobs) as pool:
+                for i, level in enumerate(levels):
+                    to_compute, keys = self._load_cached(df, features, level, outputs)
+                    process_level = [pos for pos in to_compute if pos in in_processes]
+                    thread_level = [
+                        pos for pos in to_compute if pos not in in_processes
+                    ]
+                    if process_level:
+                        workers.submit(features, process_level)
+                    self._run_in_threads(pool, df, features, thread_level, outputs)
+                    if process_level:
+                        workers.collect(features, process_level, outputs)
+                    self._store_cached(keys, outputs)
+                    if i + 1 < len(levels):
+                        if workers is not None:
+                            workers.publish(level, levels[i + 1 :], inputs, outputs)
+                        df = self._extend_with_level(df, level, outputs)
+            feat_df = self._outputs_to_frame(df.index, outputs)
+            completed = True
+        finally:
+            # the views of the shared output block go before it's released
+            del outputs[:]
+            if workers is not None:
+                workers.stop(terminate=not completed)
         return feat_df
 
-    def _set_processes(self, df):
-        manager = Manager()
-        self.return_dict = manager.dict()
-        self.processes = []
-        for i in range(self.n_jobs):
-            proc = Process(target=self._get_feature, args=(df, self.return_dict, i))
-            self.processes.append(proc)
-
-    def _start_processes(self):
-        for p in self.processes:
-            p.start()
-
-    def _get_feature(self, df, return_dict, thread_id):
-        while True:
-            feat = self._queue.get()
-            if not feat:
-                self._queue.task_done()
-                break
-            try:
+    def _run_in_threads(self, pool, df, features, level, outputs):
+        """Every thread writes the [(name, values)] of its feature in its own
+        slot of outputs"""
+
+        def add_feature(position):
+            func = features[position]
+            self._logger.debug("[thread] feature: {}".format(self.namer(func)))
+            outputs[position] = self._named_results(func, func(df))
+
+        for job in [pool.submit(add_feature, position) for position in level]:
+            job.result()
+
+    def _extend_with_level(self, df, level, outputs):
+        """df with the outputs of level, for the threads of the next levels"""
+        columns = {name: values for pos in level for name, values in outputs[pos]}
+        level_df = pd.DataFrame(columns, index=df.index)
+        return pd.concat([df, level_df], axis=1, copy=False)
+
+    def _get_feature(self, frame, output_spec, tasks, results, thread_id):
+        base_df = frame.attach()
+        block, output = _attach_shared_array(*output_spec, "float32", order="F")
+        attached = {}
+        try:
+            while True:
+                task = tasks.get()
+                if task is None:
+                    tasks.task_done()
+                    break
+                position, feat, extras = task
                 self._logger.debug(
                     "[thread {}] feature: {}".format(thread_id, self.namer(feat))
                 )
-                feature = self._get_feat_as_dict(df, feat)
-                return_dict.update(feature)
-            except KeyError as e:
-                self._handle_missing_key(feat, return_dict, df, e)
-            self._queue.task_done()
-
-    def _handle_missing_key(self, feat, return_dict, df, exception):
-        missing_key = exception.args[0]
-        self._logger.debug("Missing key: {}; placing back in queue".format(missing_key))
-        if missing_key in return_dict:
-            df[missing_key] = return_dict[missing_key]
-        self._queue.put(feat)
-
-    def _terminate(self):
-        """wait until queue is empty and terminate processes"""
-        self._queue.join()
-        for p in self.processes:
-            p.terminate()
-
-    def _add_features_to_df(self, df, feat_dict):
-        for key, values in feat_dict.items():
-            df[key] = values
-        return df
-
-    def _get_feat_as_dict(self, df, feat):
-        result = feat(df)
-        sanitised = self._sanitise(result)
-        features = {}
-        func_name = self.namer(feat)
-        for values, name in sanitised:
-            name = func_name if name is None else name
-            features["feat:" + name] = self._postprocess_features(values)
-        return features
+                try:
+                    df = self._extend_frame(base_df, extras, attached)
+                    names, extra_spec = self._write_feature(df, feat, output, position)
+                    results.put((position, names, extra_spec, None))
+                except Exception:  # pylint: disable=broad-except
+                    results.put((position, None, None, traceback.format_exc()))
+                tasks.task_done()
+        finally:
+            del base_df, output
+            frame.close()
+            block.close()
+            for extra, _ in attached.values():
+                extra.close()
+
+    def _extend_frame(self, df, extras, attached):
+        """df with the columns of the previous levels in extras, attached once"""
+        if not extras:
+            return df
+        frames = [df]
+        for extra in extras:
+            if extra.key not in attached:
+                attached[extra.key] = (extra, extra.attach())
+            frames.append(attached[extra.key][1])
+        return pd.concat(frames, axis=1, copy=False)
+
+    def _write_feature(self, df, feat, output, position):
+        """Writes the values of feat into its slot of output, or into a new
+        shared block when it returns several columns"""
+        named_results = self._named_results(feat, feat(df))
+        names = [name for name, _ in named_results]
+        if len(named_results) == 1:
+            output[:, position] = named_results[0][1]
+            return names, None
+        block, values = _create_shared_array(
+            (len(df), len(names)), "float32", order="F"
+        )
+        for i, (_, feat_values) in enumerate(named_results):
+            values[:, i] = feat_values
+        extra_spec = (block.name, values.shape, "float32")
+        del values
+        block.close()
+        return names, extra_spec
 
 
 class SerialFeatureGenerator(_FeatureGenerator, SeriallyAddFeaturesMixin):
@@ -181,3 +731,18 @@ class SerialFeatureGenerator(_FeatureGenerator, SeriallyAddFeaturesMixin):
 
 class ParallelFeatureGenerator(_FeatureGenerator, ParallelAddFeaturesMixin):
     pass
+
+
+class ThreadedFeatureGenerator(ParallelFeatureGenerator):
+    backend = "thread"
+
+
+class AutoFeatureGenerator(ParallelFeatureGenerator):
+    backend = "auto"
+
+
+PARALLEL_GENERATORS = {
+    "process": ParallelFeatureGenerator,
+    "thread": ThreadedFeatureGenerator,
+    "auto": AutoFeatureGenerator,
+}
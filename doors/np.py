@@ -1,11 +1,14 @@
 """Set of tools to help with vectorial calculations and cleaning"""
 
 from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
 
 import numpy as np
 import pandas as pd
 
-# from numba import jit
+from doors import backends, rolling
 
 # pylint: disable=missing-docstring
 # pylint: disable=invalid-name
@@ -20,27 +23,27 @@ def IQR(v):
 
 
 def moving_average(array, window, center=False, min_periods=1):
-    """may be not the fastest option for long arrays"""
-    return (
-        pd.DataFrame(array)
-        .rolling(window, center=center, min_periods=min_periods)
-        .mean()
-        .to_numpy()
-        .squeeze()
-    )
+    return _moving(rolling.rolling_mean, array, window, center, min_periods)
 
 
 def moving_median(array, window, center=False):
-    """may be not the fastest option for long arrays"""
-    return (
-        pd.DataFrame(array)
-        .rolling(window, center=center, min_periods=1)
-        .median()
-        .values.squeeze()
-    )
+    return _moving(rolling.rolling_median, array, window, center, 1)
+
+
+def _moving(func, array, window, center, min_periods):
+    """rolling func over a vector or over every column of a matrix"""
+    array = np.asarray(array)
+    if array.ndim == 2:
+        columns = [array[:, i] for i in range(array.shape[1])]
+        result = np.column_stack(
+            [_moving(func, c, window, center, min_periods) for c in columns]
+        )
+        return result.squeeze()
+    if center:
+        return rolling.centered(func, array, window, min_periods=min_periods)
+    return func(array, window, min_periods=min_periods)
 
 
-# @jit(nopython=True)
 def fillna(array, na_value):
     array = array.copy()
     ix = np.isnan(array) | np.isinf(array)
@@ -95,25 +98,196 @@ def is_datetime(v):
     return "datetime" in str(v.dtype)
 
 
+class GroupIndex(object):
+    """Factorized group keys, built once and reused by every grouped operation.
+
+    Can be passed instead of the raw ids to group_apply, simple_group_apply,
+    get_group_ixs and to the grouped helpers in doors.features, so the keys are
+    only hashed and sorted once.
+
+    Attributes:
+        codes: group code (0 .. n_groups - 1) of every row
+        order: stable permutation that sorts the rows by group
+        offsets: start of every group in the sorted order, plus the total length
+        reverse: inverse of order, maps sorted positions back to rows
+        null_keys: rows with a null key, every one of them is a group of its
+            own, so rows with a missing id never share a history
+    """
+
+    def __init__(self, *group_ids, strkeys=False):
+        self._group_ids = _split_group_ids(group_ids)
+        self.codes, self.null_keys = _factorize(self._group_ids, strkeys=strkeys)
+        self.order = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes)
+        self.n_groups = len(counts)
+        self.offsets = np.r_[0, np.cumsum(counts)]
+        self.reverse = invert_argsort(self.order)
+        self.is_sorted = False
+
+    def sorted_view(self):
+        """Index of the same groups over the rows already sorted with order.
+
+        sort and unsort are no-ops on the view, so functions given the view and
+        the sorted rows skip their own permutations.
+        """
+        view = GroupIndex.__new__(GroupIndex)
+        view._group_ids = [ids[self.order] for ids in self._group_ids]
+        view.codes = self.codes[self.order]
+        view.null_keys = self.null_keys[self.order]
+        view.order = np.arange(len(self.codes))
+        view.n_groups = self.n_groups
+        view.offsets = self.offsets
+        view.reverse = view.order
+        view.is_sorted = True
+        return view
+
+    def __len__(self):
+        return len(self.codes)
+
+    @property
+    def starts(self):
+        return self.offsets[:-1]
+
+    @property
+    def sizes(self):
+        return np.diff(self.offsets)
+
+    @property
+    def keys(self):
+        """Key of every group, as tuples when grouping by several ids"""
+        first_rows = self.order[self.starts]
+        if len(self._group_ids) == 1:
+            return self._group_ids[0][first_rows]
+        return list(zip(*[ids[first_rows] for ids in self._group_ids]))
+
+    def bounds(self):
+        return zip(self.offsets[:-1], self.offsets[1:])
+
+    def sort(self, values):
+        if self.is_sorted:
+            return values
+        return values[self.order]
+
+    def unsort(self, sorted_values):
+        if self.is_sorted:
+            return sorted_values
+        return sorted_values[self.reverse]
+
+    def ixs(self):
+        """Returns a dictionary {groupby_id: group_ix}"""
+        return {
+            key: self.order[start:end]
+            for key, (start, end) in zip(self.keys, self.bounds())
+        }
+
+    def __repr__(self):
+        return "GroupIndex(n_rows={}, n_groups={})".format(len(self), self.n_groups)
+
+
+def as_group_index(group_ids, strkeys=False):
+    if isinstance(group_ids, GroupIndex):
+        return group_ids
+    return GroupIndex(group_ids, strkeys=strkeys)
+
+
+def _split_group_ids(group_ids):
+    columns = []
+    for ids in group_ids:
+        ids = np.asarray(ids)
+        if ids.ndim == 2:
+            columns.extend(ids[:, i] for i in range(ids.shape[1]))
+        else:
+            columns.append(ids)
+    return columns
+
+
+def _factorize(columns, strkeys=False):
+    """Group codes of the rows and the mask of the rows with a null key, which
+    get a code of their own each (like the sort based group_apply did). Several
+    key columns are factorized one by one and their codes combined into a single
+    int64 key, unless strkeys is True, in which case the columns are joined as
+    strings (slow, kept for compatibility)."""
+    if strkeys and len(columns) > 1:
+        columns = [add_as_strings(*columns, sep="_")]
+    codes = [_factorize_column(ids) for ids in columns]
+    null_keys = np.zeros(len(codes[0]), dtype=bool)
+    for column_codes in codes:
+        null_keys |= column_codes < 0
+    if len(codes) > 1:
+        codes = [_combine_codes([np.maximum(c, 0) for c in codes])]
+    group_codes = codes[0]
+    if null_keys.any():
+        group_codes[null_keys] = -1 - np.arange(null_keys.sum())
+        group_codes = _factorize_column(group_codes)
+    return group_codes, null_keys
+
+
+def _factorize_column(ids):
+    """codes of the ids in order of appearance, -1 for nulls"""
+    codes, _ = pd.factorize(ids)
+    return codes.astype(np.int64, copy=False)
+
+
+def _combine_codes(codes):
+    cardinalities = [int(c.max()) + 1 if len(c) else 1 for c in codes]
+    if np.prod(cardinalities, dtype=float) >= np.iinfo(np.int64).max:
+        return _lexsort_codes(codes)
+    combined = np.zeros(len(codes[0]), dtype=np.int64)
+    for column_codes, cardinality in zip(codes, cardinalities):
+        combined *= cardinality
+        combined += column_codes
+    return _factorize_column(combined)
+
+
+def _lexsort_codes(codes):
+    """Group codes for keys whose combined cardinality would overflow an int64"""
+    order = np.lexsort(codes[::-1])
+    new_group = np.zeros(max(len(order) - 1, 0), dtype=bool)
+    for column_codes in codes:
+        sorted_codes = column_codes[order]
+        new_group |= sorted_codes[1:] != sorted_codes[:-1]
+    group_codes = np.empty(len(order), dtype=np.int64)
+    group_codes[order] = np.cumsum(np.r_[False, new_group])
+    return group_codes
+
+
 def simple_group_apply(values, group_ids, func):
     output = np.repeat(np.nan, len(values))
-    ixs = get_group_ixs(group_ids)
-    for ix in ixs.values():
+    index = as_group_index(group_ids)
+    for start, end in index.bounds():
+        ix = index.order[start:end]
         output[ix] = func(values[ix])
     return output
 
 
-def group_apply(values, group_ids, func, multiarg=False, strout=False):
-    if group_ids.ndim == 2:
-        group_ids = add_as_strings(
-            *[group_ids[:, i] for i in range(group_ids.shape[1])], sep="_"
-        )
-
-    ix = np.argsort(group_ids, kind="mergesort")
-    sids = group_ids[ix]
-    cuts = sids[1:] != sids[:-1]
-    reverse = invert_argsort(ix)
-    values = values[ix]
+def group_apply(
+    values,
+    group_ids,
+    func,
+    multiarg=False,
+    strout=False,
+    strkeys=False,
+    n_jobs=1,
+    backend="process",
+):
+    """Applies func to the values of every group, keeping the original row order.
+
+    group_ids can be an array of ids (2-D for several keys) or a GroupIndex.
+    Several keys are combined from their integer codes, strkeys=True joins them
+    as strings instead (the old, much slower behaviour).
+    func can also be the name of a built-in aggregation (broadcast back to every
+    row of the group) or transform, see GROUP_AGGREGATIONS and GROUP_TRANSFORMS.
+    These run in a single vectorized pass instead of one call per group.
+    With n_jobs > 1 the groups are split in chunks of similar row counts and
+    processed by a pool of workers. backend="process" shares the values and the
+    output through shared memory (func must be picklable), backend="thread" is
+    cheaper and only pays off when func releases the GIL.
+    """
+    index = as_group_index(group_ids, strkeys=strkeys)
+    assert len(index) == len(values), "values and group_ids lengths differ"
+    if isinstance(func, str):
+        return _named_group_apply(values, index, func)
+    values = index.sort(values)
 
     if strout:
         nvalues = np.prod(values.shape)
@@ -123,19 +297,194 @@ def group_apply(values, group_ids, func, multiarg=False, strout=False):
     else:
         res = np.nan * np.zeros(values.shape)
 
-    prevcut = 0
-    for cut in np.where(cuts)[0] + 1:
+    if n_jobs == 1:
+        _apply_groups(values, res, index.offsets, func, multiarg)
+    elif backend == "thread":
+        _thread_apply_groups(values, res, index.offsets, func, multiarg, n_jobs)
+    elif backend == "process":
+        _process_apply_groups(values, res, index.offsets, func, multiarg, n_jobs)
+    else:
+        raise ValueError("backend must be 'process' or 'thread'")
+    return index.unsort(res)
+
+
+def _apply_groups(values, res, offsets, func, multiarg):
+    for start, end in zip(offsets[:-1], offsets[1:]):
         if multiarg:
-            res[prevcut:cut] = func(*values[prevcut:cut].T)
+            res[start:end] = func(*values[start:end].T)
         else:
-            res[prevcut:cut] = func(values[prevcut:cut])
-        prevcut = cut
-    if multiarg:
-        res[prevcut:] = func(*values[prevcut:].T)
-    else:
-        res[prevcut:] = func(values[prevcut:])
-    revd = res[reverse]
-    return revd
+            res[start:end] = func(values[start:end])
+
+
+def _chunk_offsets(offsets, n_chunks):
+    """Splits the group offsets in chunks with a similar number of rows"""
+    targets = np.linspace(0, offsets[-1], n_chunks + 1)
+    cuts = np.unique(np.searchsorted(offsets, targets))
+    cuts[-1] = len(offsets) - 1
+    return [offsets[start : end + 1] for start, end in zip(cuts[:-1], cuts[1:])]
+
+
+def _thread_apply_groups(values, res, offsets, func, multiarg, n_jobs):
+    chunks = _chunk_offsets(offsets, n_jobs)
+    with ThreadPoolExecutor(max_workers=n_jobs) as pool:
+        jobs = [
+            pool.submit(_apply_groups, values, res, chunk, func, multiarg)
+            for chunk in chunks
+        ]
+        for job in jobs:
+            job.result()
+
+
+def _process_apply_groups(values, res, offsets, func, multiarg, n_jobs):
+    if values.dtype.hasobject or res.dtype.hasobject:
+        raise ValueError("the process backend needs numeric values and output")
+    chunks = _chunk_offsets(offsets, n_jobs)
+    values_shm = _to_shared_memory(values)
+    res_shm = _to_shared_memory(res)
+    try:
+        values_spec = (values_shm.name, values.shape, values.dtype)
+        res_spec = (res_shm.name, res.shape, res.dtype)
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            jobs = [
+                pool.submit(
+                    _apply_groups_in_shared_memory,
+                    values_spec,
+                    res_spec,
+                    chunk,
+                    func,
+                    multiarg,
+                )
+                for chunk in chunks
+            ]
+            for job in jobs:
+                job.result()
+        res[:] = np.ndarray(res.shape, dtype=res.dtype, buffer=res_shm.buf)
+    finally:
+        for shm in (values_shm, res_shm):
+            shm.close()
+            shm.unlink()
+
+
+def _to_shared_memory(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    shared = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    shared[:] = array
+    return shm
+
+
+def _apply_groups_in_shared_memory(values_spec, res_spec, offsets, func, multiarg):
+    values_shm = shared_memory.SharedMemory(name=values_spec[0])
+    res_shm = shared_memory.SharedMemory(name=res_spec[0])
+    try:
+        values = np.ndarray(values_spec[1], dtype=values_spec[2], buffer=values_shm.buf)
+        res = np.ndarray(res_spec[1], dtype=res_spec[2], buffer=res_shm.buf)
+        _apply_groups(values, res, offsets, func, multiarg)
+        del values, res
+    finally:
+        values_shm.close()
+        res_shm.close()
+
+
+def _named_group_apply(values, index, func):
+    name = func.lower()
+    values = np.asarray(values, dtype=float)
+    if len(values) == 0:
+        return values.copy()
+    if name in GROUP_AGGREGATIONS:
+        aggregated = GROUP_AGGREGATIONS[name](index.sort(values), index)
+        return aggregated[index.codes]
+    if name in GROUP_TRANSFORMS:
+        transformed = GROUP_TRANSFORMS[name](index.sort(values), index)
+        return index.unsort(transformed)
+    names = sorted(GROUP_AGGREGATIONS) + sorted(GROUP_TRANSFORMS)
+    raise ValueError("func must be a callable or one of {}".format(names))
+
+
+def _sizes_like(sizes, values):
+    """group sizes shaped to broadcast against per group results of values"""
+    return sizes.reshape((-1,) + (1,) * (values.ndim - 1))
+
+
+def _group_sum(svalues, index):
+    return np.add.reduceat(svalues, index.starts, axis=0)
+
+
+def _group_mean(svalues, index):
+    return _group_sum(svalues, index) / _sizes_like(index.sizes, svalues)
+
+
+def _group_std(svalues, index):
+    """population std (ddof=0), like np.std"""
+    means = np.repeat(_group_mean(svalues, index), index.sizes, axis=0)
+    squares = _group_sum((svalues - means) ** 2, index)
+    return np.sqrt(squares / _sizes_like(index.sizes, svalues))
+
+
+def _group_count(svalues, index):
+    counts = _sizes_like(index.sizes, svalues).astype(float)
+    return np.broadcast_to(counts, (index.n_groups,) + svalues.shape[1:])
+
+
+def _group_cumsum(svalues, index):
+    """the sums restart at every group, so nulls, infs and large values only
+    affect their own group"""
+    values = np.asarray(svalues, dtype=float).reshape(len(svalues), -1)
+    cumsums = backends.get_kernel("group_cumsum")(values, index.offsets)
+    return cumsums.reshape(svalues.shape)
+
+
+def equal_size_group_rows(offsets):
+    """Yields the rows of the groups of a sorted array in blocks of groups of
+    the same size, as a matrix with a row per group. Lets numpy run a
+    sequential operation along axis 1 restarting at every group, with one call
+    per distinct group size."""
+    sizes = np.diff(offsets)
+    for size in np.unique(sizes[sizes > 0]):
+        starts = offsets[:-1][sizes == size]
+        yield starts[:, None] + np.arange(size)
+
+
+@backends.register("group_cumsum")
+def _group_cumsum_blocks(values, offsets):
+    result = np.empty(values.shape)
+    for rows in equal_size_group_rows(offsets):
+        result[rows] = np.cumsum(values[rows], axis=1)
+    return result
+
+
+@backends.register_jit("group_cumsum")
+def _group_cumsum_loop(values, offsets):
+    result = np.empty(values.shape)
+    for g in range(len(offsets) - 1):
+        for j in range(values.shape[1]):
+            total = 0.0
+            for i in range(offsets[g], offsets[g + 1]):
+                total += values[i, j]
+                result[i, j] = total
+    return result
+
+
+def _group_cumcount(svalues, index):
+    positions = np.arange(len(svalues)) - np.repeat(index.starts, index.sizes)
+    positions = _sizes_like(positions, svalues).astype(float)
+    return np.broadcast_to(positions, svalues.shape).copy()
+
+
+GROUP_AGGREGATIONS = {
+    "sum": _group_sum,
+    "mean": _group_mean,
+    "min": lambda svalues, index: np.minimum.reduceat(svalues, index.starts, axis=0),
+    "max": lambda svalues, index: np.maximum.reduceat(svalues, index.starts, axis=0),
+    "count": _group_count,
+    "std": _group_std,
+    "first": lambda svalues, index: svalues[index.starts],
+    "last": lambda svalues, index: svalues[index.offsets[1:] - 1],
+}
+
+GROUP_TRANSFORMS = {
+    "cumsum": _group_cumsum,
+    "cumcount": _group_cumcount,
+}
 
 
 def invert_argsort(argsort_ix):
@@ -168,13 +517,62 @@ def get_group_ixs(*group_ids, **kwargs):
 
     group_ids:
         List of IDs to groupbyy
+        or a single GroupIndex
     kwargs:
-        bools = True or False, if True returns a boolean array
+        compact = True or False, if True returns a GroupIxs mapping that keeps all
+        the indices in one permutation array instead of a dict of arrays
+        bools = True or False, if True the mapping returns boolean arrays
     """
-    group_ids = _ensure_group_ids_hashable(group_ids)
-    grouped_ixs = _get_group_ixs(group_ids)
-    grouped_ixs = _convert_int_indices_to_bool_indices_if_necessary(grouped_ixs, kwargs)
-    return grouped_ixs
+    compact = kwargs.get("compact", False)
+    bools = kwargs.get("bools", False)
+    if len(group_ids) == 1 and isinstance(group_ids[0], GroupIndex):
+        index = group_ids[0]
+    elif compact or bools:
+        index = GroupIndex(*group_ids)
+    else:
+        group_ids = _ensure_group_ids_hashable(group_ids)
+        return _get_group_ixs(group_ids)
+    if compact or bools:
+        return GroupIxs.from_group_index(index, bools=bools)
+    return index.ixs()
+
+
+class GroupIxs(Mapping):
+    """Compact {groupby_id: group_ix} mapping, stored CSR-style.
+
+    The indices of group i are perm[offsets[i]:offsets[i + 1]] and its key is
+    unique_keys[i]. Indices (or boolean masks when bools is True) are only built
+    for the groups that are looked up.
+    """
+
+    def __init__(self, perm, offsets, unique_keys, bools=False):
+        self.perm = perm
+        self.offsets = offsets
+        self.unique_keys = unique_keys
+        self.bools = bools
+        self._positions = None
+
+    @classmethod
+    def from_group_index(cls, index, bools=False):
+        return cls(index.order, index.offsets, index.keys, bools=bools)
+
+    def __getitem__(self, key):
+        if self._positions is None:
+            self._positions = {k: i for i, k in enumerate(self.unique_keys)}
+        i = self._positions[key]
+        ix = self.perm[self.offsets[i] : self.offsets[i + 1]]
+        if self.bools:
+            return ix_to_bool(ix, len(self.perm))
+        return ix
+
+    def __iter__(self):
+        return iter(self.unique_keys)
+
+    def __len__(self):
+        return len(self.unique_keys)
+
+    def __repr__(self):
+        return "GroupIxs(n_rows={}, n_groups={})".format(len(self.perm), len(self))
 
 
 def _ensure_group_ids_hashable(group_ids):
@@ -191,15 +589,6 @@ def _ensure_group_ids_hashable(group_ids):
     return hashable_group_ids
 
 
-def _convert_int_indices_to_bool_indices_if_necessary(ixs, kwargs):
-    bools = kwargs.get("bools", False)
-    if bools:
-        length = np.sum([len(v) for v in ixs.values()])
-        ix_to_bool = lambda v, length: np.ix_to_bool(v, length)  # noqa E731
-        ixs = {k: ix_to_bool(v, length) for k, v in ixs.items()}
-    return ixs
-
-
 def _get_group_ixs(ids):
     id_hash = defaultdict(list)
     for j, key in enumerate(ids):
@@ -257,15 +646,77 @@ def nan_allclose(x, y):
     return np.all(nan_close)
 
 
-def ffill(values):
-    """vector only"""
-    assert len(values.shape) == 1 or values.shape[1] == 1, "ffill only works for vector"
-    values = np.atleast_2d(values)
-    mask = is_null(values)
-    idx = np.where(~mask, np.arange(mask.shape[1]), 0)
-    idx = np.maximum.accumulate(idx, axis=1, out=idx)
-    out = values[np.arange(idx.shape[0])[:, None], idx]
-    out = out.squeeze()
+def ffill(values, group_ids=None, limit=None, out=None):
+    """Forward fills nulls (NaN, NaT, None) with the last non null value.
+
+    Matrices are filled column by column. group_ids (ids or a GroupIndex) stops
+    values leaking from one group to the next, limit caps the number of
+    consecutive nulls filled and out is an optional buffer for the result.
+    """
+    plain = group_ids is None and limit is None and out is None
+    if plain and values.ndim == 1 and values.dtype.kind == "f":
+        return backends.get_kernel("ffill")(values)
+    return _fill(values, group_ids, limit, out, backward=False)
+
+
+def bfill(values, group_ids=None, limit=None, out=None):
+    """Backward fills nulls with the next non null value, see ffill"""
+    return _fill(values, group_ids, limit, out, backward=True)
+
+
+@backends.register("ffill")
+def _ffill(values):
+    return _fill(values, None, None, None, backward=False)
+
+
+def _fill(values, group_ids, limit, out, backward):
+    values = np.asarray(values)
+    n_rows = len(values)
+    if group_ids is None:
+        index = None
+        group_starts = np.zeros(n_rows, dtype=np.int64)
+        group_ends = np.repeat(n_rows - 1, n_rows)
+    else:
+        index = as_group_index(group_ids)
+        values = index.sort(values)
+        group_starts = np.repeat(index.starts, index.sizes)
+        group_ends = np.repeat(index.offsets[1:] - 1, index.sizes)
+
+    shape = (-1,) + (1,) * (values.ndim - 1)
+    positions = np.arange(n_rows).reshape(shape)
+    valid = ~is_null(values)
+    if backward:
+        source = np.where(valid, positions, n_rows)
+        source = np.minimum.accumulate(source[::-1], axis=0)[::-1]
+        filled = source <= group_ends.reshape(shape)
+        distance = source - positions
+    else:
+        source = np.where(valid, positions, -1)
+        source = np.maximum.accumulate(source, axis=0)
+        filled = source >= group_starts.reshape(shape)
+        distance = positions - source
+    if limit is not None:
+        filled &= distance <= limit
+    source = np.where(filled, source, positions)
+    result = np.take_along_axis(values, source, axis=0)
+
+    if index is not None:
+        if out is None:
+            out = np.empty_like(result)
+        out[index.order] = result
+        return out
+    if out is not None:
+        out[...] = result
+        return out
+    return result
+
+
+@backends.register_jit("ffill")
+def _ffill_loop(values):
+    out = values.copy()
+    for i in range(1, len(out)):
+        if np.isnan(out[i]):
+            out[i] = out[i - 1]
     return out
 
 
@@ -276,11 +727,26 @@ def is_null(*args, **kwargs):
 isnull = is_null
 
 
-# @jit(nopython=True)
 def lag(v, init, shift=1):
+    if v.ndim == 1 and v.dtype.kind == "f":
+        return backends.get_kernel("lag")(v, init, shift)
+    return _lag(v, init, shift)
+
+
+@backends.register("lag")
+def _lag(v, init, shift):
     w = np.nan * v
     w[0:shift] = init
-    w[shift:] = v[:-shift]
+    if shift < len(v):
+        w[shift:] = v[: len(v) - shift]
+    return w
+
+
+@backends.register_jit("lag")
+def _lag_loop(v, init, shift):
+    w = np.empty_like(v)
+    for i in range(len(v)):
+        w[i] = init if i < shift else v[i - shift]
     return w
 
 
@@ -288,6 +754,45 @@ def lagged_cumsum(v, init, shift=1):
     return lag(np.cumsum(v, axis=0), init, shift=shift)
 
 
+def group_lag(values, group_ids, init, shift=1):
+    """lag within every group, the first `shift` rows of each group get init.
+    A negative shift leads. group_ids can be ids or a GroupIndex."""
+    index = as_group_index(group_ids)
+    svalues = index.sort(np.asarray(values, dtype=float))
+    return index.unsort(_sorted_group_lag(svalues, index, init, shift))
+
+
+def group_lead(values, group_ids, init, shift=1):
+    return group_lag(values, group_ids, init, shift=-shift)
+
+
+def group_lagged_cumsum(values, group_ids, init, shift=1):
+    index = as_group_index(group_ids)
+    svalues = index.sort(np.asarray(values, dtype=float))
+    cumsums = _group_cumsum(svalues, index)
+    return index.unsort(_sorted_group_lag(cumsums, index, init, shift))
+
+
+def group_lagged_cumcount(group_ids, init, shift=1):
+    """number of rows of the group up to `shift` rows before the current one"""
+    index = as_group_index(group_ids)
+    return group_lagged_cumsum(np.ones(len(index)), index, init, shift=shift)
+
+
+def _sorted_group_lag(svalues, index, init, shift):
+    lagged = np.empty(svalues.shape)
+    if shift >= 0:
+        lagged[shift:] = svalues[: max(len(svalues) - shift, 0)]
+        rows_in_group = np.arange(len(svalues)) - np.repeat(index.starts, index.sizes)
+    else:
+        lagged[:shift] = svalues[-shift:]
+        group_ends = np.repeat(index.offsets[1:], index.sizes)
+        rows_in_group = group_ends - 1 - np.arange(len(svalues))
+    outside = rows_in_group < abs(shift)
+    lagged[outside] = init
+    return lagged
+
+
 def rank(array):
     """
     Returns rank of element in an array, with greatest value having the greatest
@@ -304,32 +809,15 @@ def rank(array):
 
 
 def rolling_mean(v, window):
-    out = np.nan * v
-    cumsums = np.cumsum(v)
-    length = len(v)
-    if length <= window:
-        out = 1.0 * cumsums / (np.arange(length) + 1)
-    else:
-        out[:window] = 1.0 * cumsums[:window] / (np.arange(window) + 1)
-        out[window:] = (cumsums[window:] - cumsums[: length - window]) / window
-    return out
+    return rolling.rolling_mean(v, window)
 
 
 def get_rolling_std(v, window):
-    rolling_means = rolling_mean(v, window)
-    deviation = (v - rolling_means) ** 2
-    cum_deviation = np.cumsum(deviation)
-    diff = cum_deviation[window:] - cum_deviation[:-window]
-    mean_diff = diff / window
-    for i in range(min(window, len(v))):
-        mean_diff = np.insert(mean_diff, i, cum_deviation[i] / (i + 1))
-    return np.sqrt(mean_diff)
+    return rolling.rolling_std(v, window)
 
 
 def get_rolling_sharpe(v, window):
-    rolling_means = rolling_mean(v, window)
-    rolling_std = get_rolling_std(v, window)
-    return rolling_means / rolling_std
+    return rolling.rolling_sharpe(v, window)
 
 
 # Losses
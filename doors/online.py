@@ -0,0 +1,215 @@
+"""Online versions of the grouped features in doors.features.
+
+Every updater keeps the end-of-history state of each group, so the features of
+new rows are produced in O(1) per row without recomputing the whole history:
+    ema = OnlineEMA("price", n_period=5, groupby="runner_id").fit(history_df)
+    ema.save(path)
+    ...
+    ema = OnlineFeature.load(path)
+    values = ema.update(new_rows_df)
+The rows of every group must arrive in the same order the batch functions see.
+"""
+
+from collections import deque
+
+import numpy as np
+
+from doors import inout
+
+# pylint: disable=invalid-name
+
+NS_PER_DAY = 24 * 60 * 60 * 1e9
+
+
+class OnlineFeature(object):
+    """Base class, subclasses define the columns they read and a _step that takes
+    the state of the group and the values of a row and returns (output, state)."""
+
+    columns = ()
+
+    def __init__(self, groupby):
+        self.groupby = groupby
+        self.states = {}
+
+    def fit(self, df):
+        """Resets the state and consumes the history in df"""
+        self.states = {}
+        self.update(df)
+        return self
+
+    def update(self, df):
+        """Returns the feature for the rows in df and moves the state forward"""
+        keys = df[self.groupby].values
+        columns = [self._get_column(df, col) for col in self.columns]
+        result = np.empty(len(df))
+        for i, (key, *values) in enumerate(zip(keys, *columns)):
+            result[i], self.states[key] = self._step(self.states.get(key), *values)
+        return result
+
+    def _get_column(self, df, col):
+        return df[col].values
+
+    def _step(self, state, *values):
+        raise NotImplementedError
+
+    def save(self, path):
+        inout.write_pickle(self, path)
+
+    @staticmethod
+    def load(path):
+        return inout.read_pickle(path)
+
+    def __repr__(self):
+        return "{}(groupby={}, n_groups={})".format(
+            type(self).__name__, self.groupby, len(self.states)
+        )
+
+
+class OnlineEMA(OnlineFeature):
+    """features.grouped_ema, or features.grouped_lagged_ema when shift > 0"""
+
+    def __init__(self, col, n_period, groupby, shift=0, init=0):
+        super().__init__(groupby)
+        if n_period < 1:
+            raise ValueError("n_period can't be less than 1")
+        self.col = col
+        self.columns = (col,)
+        self.alpha = 2.0 / (1 + n_period)
+        self.shift = shift
+        self.init = init
+
+    def _step(self, state, value):
+        if state is None:
+            ema = value
+            previous = deque(maxlen=self.shift)
+        else:
+            last_ema, previous = state
+            ema = self.alpha * value + (1 - self.alpha) * last_ema
+        if self.shift == 0:
+            return ema, (ema, previous)
+        output = previous[0] if len(previous) == self.shift else self.init
+        previous.append(ema)
+        return output, (ema, previous)
+
+
+class OnlineLaggedDecay(OnlineFeature):
+    """features.grouped_lagged_decay"""
+
+    def __init__(self, col, groupby, decay=1, fillna=0):
+        super().__init__(groupby)
+        self.col = col
+        self.columns = (col,)
+        self.decay_factor = np.exp(-decay)
+        self.fillna = fillna
+
+    def _get_column(self, df, col):
+        values = df[col].values.astype(float)
+        return np.where(np.isfinite(values), values, 0.0)
+
+    def _step(self, state, value):
+        if state is None:
+            return self.fillna, (value, 0.0)
+        previous_value, score = state
+        score = previous_value + score * self.decay_factor
+        output = score if np.isfinite(score) else self.fillna
+        return output, (value, score)
+
+
+class OnlineRolling(OnlineFeature):
+    """features.grouped_lagged_rolling_func for func "sum" or "mean".
+
+    Keeps the last window values with a running sum of the finite ones and
+    counts of the nulls and infinite ones.
+    """
+
+    def __init__(self, col, groupby, window, func="sum", fillna=-1, shift=1):
+        super().__init__(groupby)
+        if func.lower() not in ("sum", "mean"):
+            raise ValueError("func must be 'sum' or 'mean'")
+        self.col = col
+        self.columns = (col,)
+        self.window = window
+        self.func = func.lower()
+        self.fillna = fillna
+        self.shift = shift
+
+    def _get_column(self, df, col):
+        return df[col].values.astype(float)
+
+    def _step(self, state, value):
+        if state is None:
+            state = (deque(), 0.0, 0, 0, deque(maxlen=self.shift))
+        values, total, n_nulls, n_infs, previous = state
+        values.append(value)
+        n_nulls, n_infs, total = self._count(value, 1, n_nulls, n_infs, total)
+        if len(values) > self.window:
+            old = values.popleft()
+            n_nulls, n_infs, total = self._count(old, -1, n_nulls, n_infs, total)
+        rolled = self.fillna
+        if len(values) == self.window and n_nulls == 0 and n_infs == 0:
+            rolled = total if self.func == "sum" else total / self.window
+            # like wnp.fillna in the batch version, when the sum overflows
+            rolled = rolled if np.isfinite(rolled) else self.fillna
+        state = (values, total, n_nulls, n_infs, previous)
+        if self.shift == 0:
+            return rolled, state
+        output = previous[0] if len(previous) == self.shift else self.fillna
+        previous.append(rolled)
+        return output, state
+
+    @staticmethod
+    def _count(value, sign, n_nulls, n_infs, total):
+        """Adds (sign 1) or removes (sign -1) value from the window counts"""
+        if np.isnan(value):
+            return n_nulls + sign, n_infs, total
+        if np.isinf(value):
+            return n_nulls, n_infs + sign, total
+        return n_nulls, n_infs, total + sign * value
+
+
+class OnlineDaysSinceResult(OnlineFeature):
+    """features.grouped_days_since_result"""
+
+    def __init__(
+        self, groupby, col="win_flag", value=1, fillna=-1, coldate="scheduled_time"
+    ):
+        super().__init__(groupby)
+        self.col = col
+        self.coldate = coldate
+        self.columns = (col, coldate)
+        self.value = value
+        self.fillna = fillna
+
+    def _get_column(self, df, col):
+        if col == self.coldate:
+            return df[col].values.astype("datetime64[ms]")
+        return df[col].values
+
+    def _step(self, last_result_date, value, date):
+        output = self.fillna
+        if last_result_date is not None:
+            days = (date - last_result_date).astype("timedelta64[D]")
+            if not np.isnat(days):
+                output = float(days.astype(float))
+        if value >= self.value and not np.isnat(date):
+            last_result_date = date
+        return output, last_result_date
+
+
+class OnlineDaysToFirstEvent(OnlineFeature):
+    """features.days_to_first_event, for groups whose rows arrive in time order"""
+
+    def __init__(self, groupby, time_col):
+        super().__init__(groupby)
+        self.time_col = time_col
+        self.columns = (time_col,)
+
+    def _get_column(self, df, col):
+        return df[col].values.astype("datetime64[ns]")
+
+    def _step(self, first_time, time):
+        if np.isnat(time):
+            return np.nan, first_time
+        time = time.astype(np.int64)
+        first_time = time if first_time is None else min(first_time, time)
+        return (time - first_time) / NS_PER_DAY, first_time
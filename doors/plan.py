@@ -0,0 +1,199 @@
+"""Declarative grouped features, compiled into a plan that shares the sorts.
+
+Features are described as FeatureSpec(kind, column, groupby, params) records:
+    specs = [
+        FeatureSpec("ema", "price", "runner_id", {"n_period": 5}),
+        FeatureSpec("ema", "price", "runner_id", {"n_period": 20}),
+        FeatureSpec("rolling", "price", "runner_id", {"window": 3, "func": "max"}),
+        FeatureSpec("lagged_decay", "win_flag", "jockey_id", {"decay": 0.5}),
+    ]
+    feat_df = FeaturePlan(specs).execute(df)
+The plan sorts the rows once per distinct groupby, runs every kernel on the
+sorted columns (specs of the same kind and column that only differ in their
+batched params share one call) and un-permutes the outputs once. A plan, or a
+list of specs, can also be given to multifeat.generate_features.
+"""
+
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+from doors import features, np as wnp
+
+PlanKernel = namedtuple("PlanKernel", ["run", "batch_params", "column_params"])
+
+
+class FeatureSpec(namedtuple("FeatureSpec", ["kind", "column", "groupby", "params"])):
+    """A grouped feature of kind (a key of PLAN_KERNELS) on column"""
+
+    def __new__(cls, kind, column, groupby, params=None):
+        return super().__new__(cls, kind, column, groupby, dict(params or {}))
+
+    @property
+    def name(self):
+        params = ["{}={}".format(key, self.params[key]) for key in sorted(self.params)]
+        return ":".join([self.kind, self.column, str(self.groupby)] + params)
+
+
+def _ema(sdf, index, column, n_periods, kind="ema", shift=0, init=0):
+    return features.grouped_emas(
+        sdf, column, n_periods, index, kind=kind, shift=shift, init=init
+    )
+
+
+def _lagged_decay(sdf, index, column, decays, fillna=0):
+    return features.grouped_lagged_decays(sdf, index, column, decays, fillna=fillna)
+
+
+def _rolling(sdf, index, column, windows_funcs, fillna=-1, shift=1):
+    windows = list(OrderedDict.fromkeys(window for window, _ in windows_funcs))
+    funcs = list(OrderedDict.fromkeys(func.lower() for _, func in windows_funcs))
+    rolled = features.grouped_lagged_rolling_funcs(
+        sdf, index, column, windows, funcs, fillna=fillna, shift=shift
+    )
+    names = [
+        "{}_{}_{}".format(column, func.lower(), window)
+        for window, func in windows_funcs
+    ]
+    return rolled[names].values
+
+
+def _days_since_result(
+    sdf, index, column, value=1, fillna=-1, coldate="scheduled_time"
+):
+    return features.grouped_days_since_result(
+        sdf, index, col=column, value=value, fillna=fillna, coldate=coldate
+    )
+
+
+def _time_since_first_event(sdf, index, column, unit="D"):
+    return features.time_since_first_event(sdf, index, column, unit=unit)
+
+
+def _time_since_previous_event(sdf, index, column, unit="D", fillna=np.nan):
+    return features.time_since_previous_event(
+        sdf, index, column, unit=unit, fillna=fillna
+    )
+
+
+def _lag(sdf, index, column, shift=1, init=np.nan):
+    return wnp.group_lag(sdf[column].values, index, init=init, shift=shift)
+
+
+# kind -> PlanKernel(run, batch_params, column_params). Specs that only differ in
+# batch_params are computed by one call of run with the list of their values,
+# column_params name params (with their defaults) that are extra input columns.
+PLAN_KERNELS = {
+    "ema": PlanKernel(_ema, ("n_period",), {}),
+    "lagged_decay": PlanKernel(_lagged_decay, ("decay",), {}),
+    "rolling": PlanKernel(_rolling, ("window", "func"), {}),
+    "days_since_result": PlanKernel(
+        _days_since_result, (), {"coldate": "scheduled_time"}
+    ),
+    "time_since_first_event": PlanKernel(_time_since_first_event, (), {}),
+    "time_since_previous_event": PlanKernel(_time_since_previous_event, (), {}),
+    "lag": PlanKernel(_lag, (), {}),
+}
+
+
+class FeaturePlan(object):
+    """Execution plan of a list of FeatureSpec, see the module docstring"""
+
+    def __init__(self, specs, dtype=np.float32):
+        self.specs = list(specs)
+        self.dtype = dtype
+        self.steps = self._compile(self.specs)
+
+    @staticmethod
+    def _compile(specs):
+        """{groupby: {(kind, column, shared params): [spec positions]}}"""
+        steps = OrderedDict()
+        for position, spec in enumerate(specs):
+            if spec.kind not in PLAN_KERNELS:
+                raise ValueError(
+                    "kind must be one of {}, got {}".format(
+                        list(PLAN_KERNELS), spec.kind
+                    )
+                )
+            batch_params = PLAN_KERNELS[spec.kind].batch_params
+            missing = [param for param in batch_params if param not in spec.params]
+            if missing:
+                raise ValueError("{} needs the params {}".format(spec.name, missing))
+            shared = tuple(
+                sorted(
+                    (key, value)
+                    for key, value in spec.params.items()
+                    if key not in batch_params
+                )
+            )
+            batches = steps.setdefault(spec.groupby, OrderedDict())
+            batches.setdefault((spec.kind, spec.column, shared), []).append(position)
+        return steps
+
+    @property
+    def names(self):
+        return [spec.name for spec in self.specs]
+
+    @property
+    def inputs(self):
+        """Declared inputs and outputs, for the scheduler of multifeat"""
+        return self.input_columns()
+
+    @property
+    def outputs(self):
+        return self.names
+
+    def input_columns(self, groupby=None):
+        """Columns read by the plan, or by the specs of one groupby"""
+        groupbys = self.steps if groupby is None else [groupby]
+        columns = OrderedDict()
+        for key in groupbys:
+            if groupby is None:
+                columns[key] = None
+            for kind, column, shared in self.steps[key]:
+                columns[column] = None
+                shared = dict(shared)
+                for param, default in PLAN_KERNELS[kind].column_params.items():
+                    columns[shared.get(param, default)] = None
+        return list(columns)
+
+    def execute(self, df):
+        """Returns a frame with one float column per spec, named spec.name"""
+        result = np.empty((len(df), len(self.specs)), dtype=self.dtype)
+        for groupby, batches in self.steps.items():
+            index = wnp.GroupIndex(df[groupby].values)
+            sorted_index = index.sorted_view()
+            sdf = df[self.input_columns(groupby)].iloc[index.order]
+            positions = [position for ids in batches.values() for position in ids]
+            block = np.empty((len(df), len(positions)), dtype=self.dtype)
+            i = 0
+            for (kind, column, shared), ids in batches.items():
+                kernel = PLAN_KERNELS[kind]
+                if kernel.batch_params:
+                    batch = [self._batch_value(self.specs[j], kernel) for j in ids]
+                    values = kernel.run(
+                        sdf, sorted_index, column, batch, **dict(shared)
+                    )
+                else:
+                    values = kernel.run(sdf, sorted_index, column, **dict(shared))
+                values = np.asarray(values).reshape(len(df), -1)
+                block[:, i : i + len(ids)] = values
+                i += len(ids)
+            result[:, positions] = index.unsort(block)
+        return pd.DataFrame(result, index=df.index, columns=self.names)
+
+    @staticmethod
+    def _batch_value(spec, kernel):
+        values = tuple(spec.params[param] for param in kernel.batch_params)
+        return values[0] if len(values) == 1 else values
+
+    def __call__(self, df):
+        """Feature function interface of multifeat: (list of columns, names)"""
+        feat_df = self.execute(df)
+        return [feat_df[name].values for name in feat_df.columns], self.names
+
+    def __repr__(self):
+        return "FeaturePlan(n_specs={}, groupbys={})".format(
+            len(self.specs), list(self.steps)
+        )
@@ -0,0 +1,492 @@
+"""O(n) rolling window kernels for vectors.
+
+Windows are trailing: the value at i summarises v[i - window + 1 : i + 1].
+Null values are skipped and the result is NaN where a window holds fewer than
+min_periods non null values.
+"""
+
+from bisect import bisect_left, insort
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from doors import backends
+
+# pylint: disable=invalid-name
+
+
+def rolling_count(v, window):
+    """Number of non null values in every window"""
+    valid = ~np.isnan(np.asarray(v, dtype=float))
+    return np.rint(_window_sums(valid.astype(float), window))
+
+
+def rolling_sum(v, window, min_periods=1):
+    v = np.asarray(v, dtype=float)
+    sums = _window_sums(np.where(np.isnan(v), 0.0, v), window)
+    return _mask_min_periods(sums, rolling_count(v, window), min_periods)
+
+
+def rolling_mean(v, window, min_periods=1):
+    v = np.asarray(v, dtype=float)
+    counts = rolling_count(v, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = _window_sums(np.where(np.isnan(v), 0.0, v), window) / counts
+    return _mask_min_periods(means, counts, min_periods)
+
+
+def rolling_var(v, window, min_periods=1, ddof=0):
+    v = np.asarray(v, dtype=float)
+    counts, _, m2 = backends.get_kernel("rolling_moments")(v, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        variances = np.where(counts > ddof, m2 / (counts - ddof), np.nan)
+    return _mask_min_periods(variances, counts, min_periods)
+
+
+def rolling_std(v, window, min_periods=1, ddof=0):
+    return np.sqrt(rolling_var(v, window, min_periods=min_periods, ddof=ddof))
+
+
+def rolling_sharpe(v, window, min_periods=1, ddof=0):
+    v = np.asarray(v, dtype=float)
+    counts, means, m2 = backends.get_kernel("rolling_moments")(v, window)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        stds = np.sqrt(np.where(counts > ddof, m2 / (counts - ddof), np.nan))
+        sharpes = means / stds
+    return _mask_min_periods(sharpes, counts, min_periods)
+
+
+def rolling_max(v, window, min_periods=1):
+    v = np.asarray(v, dtype=float)
+    maxs = backends.get_kernel("rolling_max")(v, window)
+    return _mask_min_periods(maxs, rolling_count(v, window), min_periods)
+
+
+def rolling_min(v, window, min_periods=1):
+    v = np.asarray(v, dtype=float)
+    mins = -backends.get_kernel("rolling_max")(-v, window)
+    return _mask_min_periods(mins, rolling_count(v, window), min_periods)
+
+
+def rolling_quantile(v, window, q, min_periods=1):
+    """Linearly interpolated quantile (like pandas) of every window"""
+    v = np.asarray(v, dtype=float)
+    quantiles = backends.get_kernel("rolling_quantile")(v, window, q)
+    return _mask_min_periods(quantiles, rolling_count(v, window), min_periods)
+
+
+def rolling_median(v, window, min_periods=1):
+    return rolling_quantile(v, window, 0.5, min_periods=min_periods)
+
+
+def centered(func, v, window, **kwargs):
+    """Applies a trailing rolling func to windows centered on every value, the
+    windows at the edges are truncated"""
+    offset = (window - 1) // 2
+    padded = np.r_[np.asarray(v, dtype=float), np.repeat(np.nan, offset)]
+    return func(padded, window, **kwargs)[offset:]
+
+
+class RollingQuantile(object):
+    """Quantile of the last `window` values of a stream.
+
+    Keeps the window sorted, so every update is a bisect insertion and removal
+    instead of a sort of the whole window. Null values take a place in the window
+    but are left out of the quantile. Example:
+        median = RollingQuantile(window=3, q=0.5)
+        [median.update(x) for x in [1, 5, 2, 8]] --> [1.0, 3.0, 2.0, 5.0]
+    """
+
+    def __init__(self, window, q=0.5, min_periods=1):
+        self.window = window
+        self.q = q
+        self.min_periods = min_periods
+        self._values = deque()
+        self._sorted = []
+
+    def update(self, value):
+        """Adds value to the window and returns the current quantile"""
+        self._values.append(value)
+        if len(self._values) > self.window:
+            old = self._values.popleft()
+            if not np.isnan(old):
+                del self._sorted[bisect_left(self._sorted, old)]
+        if not np.isnan(value):
+            insort(self._sorted, value)
+        return self.value
+
+    def update_many(self, values):
+        return np.array([self.update(value) for value in values], dtype=float)
+
+    @property
+    def value(self):
+        n_values = len(self._sorted)
+        if n_values < max(self.min_periods, 1):
+            return np.nan
+        position = self.q * (n_values - 1)
+        low = int(np.floor(position))
+        high = min(low + 1, n_values - 1)
+        fraction = position - low
+        return self._sorted[low] + (self._sorted[high] - self._sorted[low]) * fraction
+
+
+@backends.register("rolling_quantile")
+def _rolling_quantile(values, window, q):
+    """batch version of RollingQuantile, from the compiled pandas kernel, which
+    leaves infs out of the windows like nulls"""
+    if len(values) == 0:
+        return np.zeros(0)
+    if np.isinf(values).any():
+        return RollingQuantile(window, q=q).update_many(values.tolist())
+    roll = pd.Series(values).rolling(min(window, len(values)), min_periods=1)
+    return roll.quantile(q, interpolation="linear").values
+
+
+@backends.register_jit("rolling_quantile")
+def _rolling_quantile_sorted(values, window, q):
+    """same as RollingQuantile, over a preallocated sorted window"""
+    n_values = len(values)
+    quantiles = np.empty(n_values)
+    window_sorted = np.empty(min(window, n_values))
+    size = 0
+    for i in range(n_values):
+        if i >= window and not np.isnan(values[i - window]):
+            j = np.searchsorted(window_sorted[:size], values[i - window])
+            for k in range(j, size - 1):
+                window_sorted[k] = window_sorted[k + 1]
+            size -= 1
+        x = values[i]
+        if not np.isnan(x):
+            j = np.searchsorted(window_sorted[:size], x)
+            for k in range(size, j, -1):
+                window_sorted[k] = window_sorted[k - 1]
+            window_sorted[j] = x
+            size += 1
+        if size == 0:
+            quantiles[i] = np.nan
+        else:
+            position = q * (size - 1)
+            low = int(np.floor(position))
+            high = min(low + 1, size - 1)
+            low_value = window_sorted[low]
+            quantiles[i] = low_value + (window_sorted[high] - low_value) * (
+                position - low
+            )
+    return quantiles
+
+
+def duration_window_bounds(times, offsets, duration, closed="right"):
+    """Rows [start, end) in the trailing time window of every row.
+
+    times are int64 timestamps sorted within every group of the sorted rows
+    delimited by offsets, duration is in the same unit. closed="right" is the
+    window (t - duration, t] up to the current row, closed="left" is
+    [t - duration, t), which leaves out every row at the current timestamp.
+    """
+    if closed not in ("right", "left"):
+        raise ValueError("closed must be 'right' or 'left'")
+    return backends.get_kernel("duration_window_bounds")(
+        times, offsets, duration, closed == "left"
+    )
+
+
+def window_sums(v, starts, ends):
+    """sum and count of the non null values of v in the rows [start, end)"""
+    v = np.asarray(v, dtype=float)
+    valid = ~np.isnan(v)
+    sums = np.r_[0.0, np.cumsum(np.where(valid, v, 0.0))]
+    counts = np.r_[0, np.cumsum(valid)]
+    return sums[ends] - sums[starts], counts[ends] - counts[starts]
+
+
+def window_max(v, starts, ends):
+    """max of the non null values of v in the rows [start, end), for windows whose
+    starts and ends never decrease"""
+    return backends.get_kernel("window_max")(np.asarray(v, dtype=float), starts, ends)
+
+
+@backends.register("duration_window_bounds")
+def _duration_window_bounds(times, offsets, duration, left_closed):
+    group_codes = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    if left_closed:
+        starts = _grouped_searchsorted(group_codes, times, times - duration, "left")
+        ends = _grouped_searchsorted(group_codes, times, times, "left")
+    else:
+        starts = _grouped_searchsorted(group_codes, times, times - duration, "right")
+        ends = np.arange(1, len(times) + 1)
+    return starts, ends
+
+
+def _grouped_searchsorted(group_codes, times, queries, side):
+    """np.searchsorted of every query within the times of its own group, done for
+    all groups at once with a lexsort of the rows and the queries together"""
+    n_rows = len(times)
+    is_query = np.r_[np.zeros(n_rows, dtype=bool), np.ones(n_rows, dtype=bool)]
+    # on ties, queries go after the rows for side="right" and before for "left"
+    ties = is_query if side == "right" else ~is_query
+    merged = np.lexsort((ties, np.r_[times, queries], np.r_[group_codes, group_codes]))
+    rows_before = np.cumsum(~is_query[merged]) - ~is_query[merged]
+    positions = np.empty(n_rows, dtype=np.int64)
+    positions[merged[is_query[merged]] - n_rows] = rows_before[is_query[merged]]
+    return positions
+
+
+@backends.register_jit("duration_window_bounds")
+def _duration_window_bounds_loop(times, offsets, duration, left_closed):
+    """two pointers sweeping every group"""
+    starts = np.empty(len(times), dtype=np.int64)
+    ends = np.empty(len(times), dtype=np.int64)
+    for g in range(len(offsets) - 1):
+        start = offsets[g]
+        end = offsets[g]
+        for i in range(offsets[g], offsets[g + 1]):
+            if left_closed:
+                while start < i and times[start] < times[i] - duration:
+                    start += 1
+                while times[end] < times[i]:
+                    end += 1
+            else:
+                while start <= i and times[start] <= times[i] - duration:
+                    start += 1
+                end = i + 1
+            starts[i] = start
+            ends[i] = end
+    return starts, ends
+
+
+@backends.register("window_max")
+def _window_max(values, starts, ends):
+    """sparse table: maxs over blocks of 2 ** k rows, every window is covered by
+    two (overlapping) blocks"""
+    valid = ~np.isnan(values)
+    counts = np.r_[0, np.cumsum(valid)]
+    values = np.where(valid, values, -np.inf)
+    lengths = ends - starts
+    tables = [values]
+    while 2 ** len(tables) <= max(lengths.max(initial=0), 1):
+        previous = tables[-1]
+        step = 2 ** (len(tables) - 1)
+        tables.append(np.maximum(previous[:-step], previous[step:]))
+    maxs = np.full(len(starts), -np.inf)
+    levels = np.floor(np.log2(np.maximum(lengths, 1))).astype(int)
+    for level, table in enumerate(tables):
+        rows = (levels == level) & (lengths > 0)
+        first = table[starts[rows]]
+        last = table[ends[rows] - 2**level]
+        maxs[rows] = np.maximum(first, last)
+    return np.where(counts[ends] > counts[starts], maxs, np.nan)
+
+
+@backends.register_jit("window_max")
+def _window_max_deque(values, starts, ends):
+    """monotonic deque, moved forward with the window starts and ends"""
+    n_windows = len(starts)
+    maxs = np.empty(n_windows)
+    queue = np.empty(len(values), dtype=np.int64)
+    head = 0
+    tail = 0
+    added = 0
+    for i in range(n_windows):
+        while added < ends[i]:
+            x = values[added]
+            if not np.isnan(x):
+                while head < tail and values[queue[tail - 1]] <= x:
+                    tail -= 1
+                queue[tail] = added
+                tail += 1
+            added += 1
+        while head < tail and queue[head] < starts[i]:
+            head += 1
+        maxs[i] = values[queue[head]] if head < tail else np.nan
+    return maxs
+
+
+def _mask_min_periods(values, counts, min_periods):
+    return np.where(counts >= max(min_periods, 1), values, np.nan)
+
+
+def _as_blocks(x, window, fill_value):
+    """x padded with fill_value and reshaped to (n_blocks, window)"""
+    n_blocks = -(-len(x) // window)
+    padded = np.full(n_blocks * window, fill_value, dtype=float)
+    padded[: len(x)] = x
+    return padded.reshape(n_blocks, window)
+
+
+def _window_sums(x, window):
+    """Trailing window sums, accumulated block by block.
+
+    The window ending at row j of block k is the head of block k up to j plus
+    the tail of block k - 1 after j, both running sums, so the rounding error
+    is bounded by the window and does not grow with the length of x like a
+    global cumsum, and an inf only reaches the windows holding it. Windows
+    longer than x are the same as windows of len(x).
+    """
+    if len(x) == 0:
+        return np.zeros(0)
+    blocks = _as_blocks(x, min(window, len(x)), 0.0)
+    sums = np.cumsum(blocks, axis=1)
+    tails = np.cumsum(blocks[:-1, :0:-1], axis=1)[:, ::-1]
+    sums[1:, :-1] += tails
+    return sums.ravel()[: len(x)]
+
+
+def _part_moments(counts, sums, squares, centers):
+    """count, mean and sum of squared deviations from sums centered on centers"""
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return counts, centers + sums / counts, squares - sums * sums / counts
+
+
+def _merge_moments(a, b):
+    """moments of the union of the parts a and b, with Chan's formula"""
+    count_a, mean_a, m2_a = a
+    count_b, mean_b, m2_b = b
+    counts = count_a + count_b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = mean_b - mean_a
+        means = mean_a + delta * count_b / counts
+        m2 = m2_a + m2_b + delta * delta * count_a * count_b / counts
+    means = np.where(count_a == 0, mean_b, np.where(count_b == 0, mean_a, means))
+    m2 = np.where(count_a == 0, m2_b, np.where(count_b == 0, m2_a, m2))
+    return counts, means, m2
+
+
+@backends.register("rolling_moments")
+def _rolling_moments(values, window):
+    """count, mean and sum of squared deviations of every window.
+
+    Like in _window_sums a window is the head of its block plus the tail of the
+    previous block. The sums of every part are centered on the mean of the
+    finite values of its block, which keeps the sums of squares close to the
+    deviations, and the two parts are merged with Chan's formula.
+    """
+    n_values = len(values)
+    if n_values == 0:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+    window = min(window, n_values)
+    valid = ~np.isnan(values)
+    finite = _as_blocks(np.isfinite(values), window, 0.0)
+    blocks = _as_blocks(np.where(valid, values, 0.0), window, 0.0)
+    centers = np.where(finite > 0, blocks, 0.0).sum(axis=1)
+    centers /= np.maximum(finite.sum(axis=1), 1)
+    valid = _as_blocks(valid, window, 0.0)
+    shifted = np.where(valid > 0, blocks - centers[:, None], 0.0)
+    heads = []
+    tails = []
+    for x in (valid, shifted, shifted**2):
+        heads.append(np.cumsum(x, axis=1))
+        tail = np.zeros(x.shape)
+        tail[1:, :-1] = np.cumsum(x[:-1, :0:-1], axis=1)[:, ::-1]
+        tails.append(tail)
+    tail_centers = np.r_[0.0, centers[:-1]]
+    counts, means, m2 = _merge_moments(
+        _part_moments(*tails, tail_centers[:, None]),
+        _part_moments(*heads, centers[:, None]),
+    )
+    m2 = np.where(counts > 0, np.maximum(m2, 0.0), 0.0)
+    return tuple(x.ravel()[:n_values] for x in (counts, means, m2))
+
+
+@backends.register_jit("rolling_moments")
+def _rolling_moments_blocks(values, window):  # noqa: C901
+    """_rolling_moments in one pass: running sums of the head of every block,
+    next to the tail sums of the previous one"""
+    n_values = len(values)
+    counts = np.zeros(n_values)
+    means = np.full(n_values, np.nan)
+    m2s = np.zeros(n_values)
+    window = max(min(window, n_values), 1)
+    tail_counts = np.zeros(window + 1)
+    tail_sums = np.zeros(window + 1)
+    tail_squares = np.zeros(window + 1)
+    tail_center = 0.0
+    for start in range(0, n_values, window):
+        end = min(start + window, n_values)
+        center = 0.0
+        n_finite = 0
+        for i in range(start, end):
+            if np.isfinite(values[i]):
+                center += values[i]
+                n_finite += 1
+        center /= max(n_finite, 1)
+        count = 0.0
+        total = 0.0
+        squares = 0.0
+        for i in range(start, end):
+            if not np.isnan(values[i]):
+                delta = values[i] - center
+                count += 1
+                total += delta
+                squares += delta * delta
+            j = i - start + 1
+            tail_count = tail_counts[j]
+            counts[i] = count + tail_count
+            if count > 0:
+                means[i] = center + total / count
+                m2s[i] = squares - total * total / count
+            if tail_count > 0:
+                tail_mean = tail_center + tail_sums[j] / tail_count
+                tail_m2 = tail_squares[j] - tail_sums[j] * tail_sums[j] / tail_count
+                if count > 0:
+                    delta = means[i] - tail_mean
+                    means[i] = tail_mean + delta * count / counts[i]
+                    m2s[i] += tail_m2 + delta * delta * count * tail_count / counts[i]
+                else:
+                    means[i] = tail_mean
+                    m2s[i] = tail_m2
+            if m2s[i] < 0:
+                m2s[i] = 0.0
+        for i in range(end - 1, start - 1, -1):
+            j = i - start
+            tail_counts[j] = tail_counts[j + 1]
+            tail_sums[j] = tail_sums[j + 1]
+            tail_squares[j] = tail_squares[j + 1]
+            if not np.isnan(values[i]):
+                delta = values[i] - center
+                tail_counts[j] += 1
+                tail_sums[j] += delta
+                tail_squares[j] += delta * delta
+        tail_center = center
+    return counts, means, m2s
+
+
+@backends.register("rolling_max")
+def _rolling_max(values, window):
+    """van Herk/Gil-Werman: max of the head of the current block and the tail of
+    the previous one, both computed with running maximums"""
+    if len(values) == 0:
+        return np.zeros(0)
+    window = min(window, len(values))
+    valid = ~np.isnan(values)
+    blocks = _as_blocks(np.where(valid, values, -np.inf), window, -np.inf)
+    prefix = np.maximum.accumulate(blocks, axis=1)
+    suffix = np.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1]
+    tails = np.full(blocks.shape, -np.inf)
+    tails[:, :-1] = suffix[:, 1:]
+    maxs = prefix.copy()
+    maxs[1:] = np.maximum(prefix[1:], tails[:-1])
+    maxs = maxs.ravel()[: len(values)]
+    counts = _window_sums(valid.astype(float), window)
+    return np.where(counts > 0.5, maxs, np.nan)
+
+
+@backends.register_jit("rolling_max")
+def _rolling_max_deque(values, window):
+    """monotonic deque of the positions of decreasing values in the window"""
+    n_values = len(values)
+    maxs = np.empty(n_values)
+    queue = np.empty(n_values, dtype=np.int64)
+    head = 0
+    tail = 0
+    for i in range(n_values):
+        if head < tail and queue[head] <= i - window:
+            head += 1
+        x = values[i]
+        if not np.isnan(x):
+            while head < tail and values[queue[tail - 1]] <= x:
+                tail -= 1
+            queue[tail] = i
+            tail += 1
+        maxs[i] = values[queue[head]] if head < tail else np.nan
+    return maxs
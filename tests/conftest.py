@@ -0,0 +1,27 @@
+# pylint: disable=missing-docstring
+import numpy as np
+import pandas as pd
+import pytest
+
+
+@pytest.fixture
+def df():
+    """Frame shared by the feature generation tests, with nulls in price and
+    win_flag and the times sorted"""
+    rng = np.random.RandomState(0)
+    n_rows = 200
+    price = rng.rand(n_rows)
+    price[rng.rand(n_rows) < 0.05] = np.nan
+    win_flag = rng.randint(0, 3, size=n_rows).astype(float)
+    win_flag[rng.rand(n_rows) < 0.05] = np.nan
+    return pd.DataFrame(
+        {
+            "price": price,
+            "size": rng.randint(0, 10, size=n_rows),
+            "group": rng.randint(0, 6, size=n_rows),
+            "other": rng.choice(["a", "b", "c"], size=n_rows),
+            "win_flag": win_flag,
+            "scheduled_time": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(np.sort(rng.randint(0, 5000, size=n_rows)), unit="h"),
+        }
+    )
@@ -0,0 +1,53 @@
+# pylint: disable=missing-docstring
+import numpy as np
+import pytest
+
+from doors import backends
+
+kernel_inputs = [
+    ("ema", (np.array([10.0, 0, 0, 5, 1]), np.array([0, 3, 5]), 0.5)),
+    ("lagged_decay", (np.array([1.0, 0, 1, 0, 1]), np.array([0, 4, 5]), np.exp(-1))),
+    ("ffill", (np.array([np.nan, 1, np.nan, 2, np.nan]),)),
+    (
+        "group_cumsum",
+        (np.array([[1.0, np.nan, 2, 3, 1e16, 4]]).T, np.array([0, 2, 4, 6])),
+    ),
+    ("lag", (np.array([1.0, 2, 3, 4]), -1.0, 2)),
+    ("lag", (np.array([1.0, 2, 3, 4], dtype=np.float32), -1.0, 2)),
+    ("lag", (np.array([1.0, 2, 3, 4]), -1.0, 0)),
+    ("lag", (np.array([1.0, 2, 3, 4]), -1.0, 5)),
+    (
+        "duration_window_bounds",
+        (np.array([1, 2, 2, 5, 0, 3, 4]), np.array([0, 4, 7]), 2, True),
+    ),
+    (
+        "duration_window_bounds",
+        (np.array([1, 2, 2, 5, 0, 3, 4]), np.array([0, 4, 7]), 2, False),
+    ),
+    (
+        "window_max",
+        (np.array([3.0, 1, np.nan, 2, 5]), np.array([0, 0, 1, 3, 3]), np.arange(5)),
+    ),
+    (
+        "window_max",
+        (np.array([-np.inf, 1, np.nan, -np.inf]), np.array([0, 0, 2, 2]), np.r_[1:5]),
+    ),
+    ("rolling_moments", (np.array([1.0, 2, np.inf, 3, np.nan, 5, 6, 1e8, 7]), 2)),
+    ("rolling_moments", (np.array([1.0, 2, np.nan, np.nan, 5, 6, 7]), 3)),
+    ("rolling_max", (np.array([-np.inf, 1, -np.inf, -np.inf, np.nan, np.inf]), 2)),
+    ("rolling_quantile", (np.array([1.0, np.inf, 3, np.nan, -np.inf, 5, 6]), 3, 0.3)),
+]
+
+
+@pytest.mark.parametrize("name, args", kernel_inputs)
+def test_backends_match(name, args):
+    expected = backends.get_kernel(name, backend=backends.NUMPY)(*args)
+    for backend in backends.available_backends():
+        result = backends.get_kernel(name, backend=backend)(*args)
+        assert np.asarray(result).dtype == np.asarray(expected).dtype
+        assert np.allclose(expected, result, equal_nan=True)
+
+
+def test_set_backend_raises_with_unknown_backend():
+    with pytest.raises(ValueError):
+        backends.set_backend("cuda")
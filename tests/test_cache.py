@@ -0,0 +1,103 @@
+# pylint: disable=missing-docstring
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from doors import multifeat
+from doors.cache import FeatureCache
+
+CALLS = []
+
+
+def double_price(df):
+    CALLS.append("double_price")
+    return df["price"].values * 2
+
+
+def price_and_size(df):
+    CALLS.append("price_and_size")
+    return [df["price"].values + 1, df["size"].values], ["price_plus_one", "size"]
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_cached_features_are_not_recomputed(df, tmp_path, n_jobs):
+    features = [double_price, price_and_size]
+    expected = multifeat.generate_features(df, features, [], n_jobs=1)
+    path = str(tmp_path / "cache")
+    multifeat.generate_features(df, features, [], n_jobs, "thread", cache=path)
+    del CALLS[:]
+    feat_df = multifeat.generate_features(df, features, [], n_jobs, cache=path)
+    pd.testing.assert_frame_equal(feat_df, expected)
+    # only the dry run on the first rows, which finds the inputs of the features
+    assert sorted(CALLS) == ["double_price", "price_and_size"]
+
+
+@multifeat.declare(inputs=["price"])
+def declared_double_price(df):
+    return df["price"].values * 2
+
+
+def test_changed_inputs_invalidate_the_cache(df, tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    features = [declared_double_price]
+    multifeat.generate_features(df, features, [], n_jobs=1, cache=cache)
+    df.loc[0, "size"] = 100
+    key = cache.key("declared_double_price", df, ["price"])
+    assert cache.get(key) is not None
+    df.loc[0, "price"] = 100
+    cache.reset_fingerprints()
+    assert cache.get(cache.key("declared_double_price", df, ["price"])) is None
+    feat_df = multifeat.generate_features(df, features, [], n_jobs=1, cache=cache)
+    assert feat_df["feat:declared_double_price"].iloc[0] == 200
+
+
+def first_col(df):
+    return df.iloc[:, 0].values * 2
+
+
+def test_features_without_known_inputs_use_every_column(df, tmp_path):
+    cache = FeatureCache(str(tmp_path))
+    multifeat.generate_features(df, [first_col], [], n_jobs=1, cache=cache)
+    df["price"] = 100.0
+    feat_df = multifeat.generate_features(df, [first_col], [], n_jobs=1, cache=cache)
+    assert (feat_df["feat:first_col"] == 200).all()
+
+
+def mixed_access(df):
+    return df["price"].values + df.iloc[:, 1].values
+
+
+def test_undeclared_inputs_use_every_column(df, tmp_path):
+    df = pd.concat([df] * 10, ignore_index=True)
+    cache = FeatureCache(str(tmp_path))
+    multifeat.generate_features(df, [mixed_access], [], n_jobs=1, cache=cache)
+    df["size"] = 100
+    feat_df = multifeat.generate_features(df, [mixed_access], [], n_jobs=1, cache=cache)
+    expected = (df["price"] + 100).astype("float32")
+    np.testing.assert_array_equal(feat_df["feat:mixed_access"], expected)
+
+
+def test_data_version(df, tmp_path):
+    cache = FeatureCache(str(tmp_path), data_version="v1")
+    assert cache.key("f", df, ["price"]) == cache.key("f", df.iloc[:3], ["size"])
+    other = FeatureCache(str(tmp_path), data_version="v2")
+    assert cache.key("f", df, ["price"]) != other.key("f", df, ["price"])
+
+
+def test_lru_eviction(tmp_path):
+    values = [("a", np.zeros(100, dtype=np.float32))]
+    cache = FeatureCache(str(tmp_path))
+    for key in ["first", "second", "third"]:
+        cache.put(key, values)
+    os.utime(str(tmp_path / "first.npy"), (0, 0))
+    os.utime(str(tmp_path / "second.npy"), (1, 1))
+    assert cache.get("first") is not None
+    entry_size = os.path.getsize(str(tmp_path / "first.npy"))
+    cache.evict(2 * entry_size)
+    assert cache.get("second") is None
+    assert cache.get("first") is not None
+    assert cache.get("third") is not None
+    cache.clear()
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,35 @@
+# pylint: disable=missing-docstring
+import numpy as np
+import pandas as pd
+
+from doors.encoders import FrequencyEncoder
+
+
+def test_frequency_encoder(tmp_path):
+    train = pd.DataFrame({"a": ["x", "y", "x", None], "b": [1, 1, 1, 2]})
+    encoder = FrequencyEncoder(["a", "b"]).fit(train)
+    expected = np.array([[2, 3], [1, 3], [2, 3], [1, 1]])
+    assert np.array_equal(encoder.transform(train), expected)
+
+    path = str(tmp_path / "encoder.pkl")
+    encoder.save(path)
+    encoder = FrequencyEncoder.load(path)
+    new = pd.DataFrame({"a": ["y", "z", None], "b": [2, 3, 1]})
+    expected = np.array([[1, 1], [0, 0], [1, 3]])
+    assert np.array_equal(encoder.transform(new), expected)
+
+
+def test_frequency_encoder_normalized():
+    train = pd.DataFrame({"a": ["x", "y", "x", "x"]})
+    encoder = FrequencyEncoder("a", normalize=True, unseen=np.nan).fit(train)
+    result = encoder.transform(pd.DataFrame({"a": ["x", "y", "w"]}))
+    assert np.allclose(result[:, 0], [0.75, 0.25, np.nan], equal_nan=True)
+
+
+def test_frequency_encoder_without_fitted_values():
+    train = pd.DataFrame({"a": [None, None], "b": [1.0, 2]})
+    encoder = FrequencyEncoder(["a", "b"], unseen=-1).fit(train)
+    result = encoder.transform(pd.DataFrame({"a": ["x", None], "b": [3.0, 1]}))
+    assert np.array_equal(result, [[-1, -1], [2, 1]])
+    encoder = FrequencyEncoder("a").fit(train.iloc[:0])
+    assert np.array_equal(encoder.transform(train)[:, 0], [0, 0])
@@ -1,23 +1,37 @@
 # pylint: disable=missing-docstring
 # pylint: disable=invalid-name
+from functools import partial
+
 import numpy as np
 import pandas as pd
+import pytest
 
+from doors import backends
 from doors.features import (
     categorical_to_frequency,
+    categorical_to_numeric,
     days_since_result,
     days_to_first_event,
+    dema,
     ema,
     grouped_days_since_result,
+    grouped_duration_rolling_funcs,
     grouped_ema,
+    grouped_emas,
     grouped_lagged_decay,
+    grouped_lagged_decays,
     grouped_lagged_ema,
     grouped_lagged_rolling_func,
+    grouped_lagged_rolling_funcs,
+    lagged_decay,
     lagged_ema,
     lagged_rolling_func,
     rolling_func,
+    time_since_first_event,
+    time_since_previous_event,
+    time_until_next_event,
 )
-from doors.np import nan_allclose
+from doors.np import GroupIndex, fillna, group_apply, lag, nan_allclose
 
 
 def test_categorical_to_frequency():
@@ -130,6 +144,40 @@ def test_grouped_ema():
     assert np.allclose(expected, grouped_ema(df, "price", 3, "group"))
 
 
+@pytest.mark.parametrize("backend", backends.available_backends())
+def test_grouped_kernels_with_infs(backend):
+    values = np.array([1, np.inf, 1, 2, 3])
+    offsets = np.array([0, 2, 4, 5])
+    emas = backends.get_kernel("ema", backend)(values, offsets, 0.5)
+    assert np.array_equal(emas, [1, np.inf, 1, 1.5, 3])
+    decays = backends.get_kernel("lagged_decay", backend)(values, offsets, 0.5)
+    assert np.array_equal(decays, [np.nan, 1, np.nan, 1, np.nan], equal_nan=True)
+    df = pd.DataFrame({"group": [0, 0, 1, 1, 2], "price": values})
+    assert np.array_equal(grouped_ema(df, "price", 3, "group"), emas)
+
+
+@pytest.mark.parametrize("name", ["ema", "lagged_decay"])
+def test_grouped_kernels_do_not_depend_on_other_groups(name):
+    values = np.r_[np.full(200000, 1e6), [1.0, 1, 1, 1, 1]]
+    offsets = np.array([0, 200000, len(values)])
+    factor = np.exp(-1e-3)
+    result = backends.get_kernel(name, backends.NUMPY)(values, offsets, factor)
+    expected = backends.get_kernel(name, backends.NUMPY)(
+        values[-5:], np.array([0, 5]), factor
+    )
+    assert np.array_equal(result[-5:], expected, equal_nan=True)
+
+
+def test_grouped_features_leave_null_keys_out():
+    df = pd.DataFrame(
+        {"group": [1, np.nan, 1, np.nan, np.nan], "x": [1.0, 10, 2, 20, 30]}
+    )
+    expected = df.groupby("group")["x"].transform(partial(ema, n_period=3))
+    assert nan_allclose(expected, grouped_ema(df, "x", 3, "group"))
+    result = grouped_lagged_rolling_func(df, "group", "x", 1, "sum", -1, 1)
+    assert nan_allclose([-1, np.nan, 1, np.nan, np.nan], result)
+
+
 def test_grouped_lagged_ema():
     df = pd.DataFrame(
         {
@@ -170,3 +218,171 @@ def test_grouped_lagged_rolling_func():
     expected = pd.Series([-1, -1, -1, -1, 10, 14] * 2)
 
     assert np.allclose(expected, result)
+
+
+def test_grouped_features_accept_group_index():
+    df = pd.DataFrame(
+        {
+            "group": np.array([1, 2, 1, 2, 1, 2, 1, 2, 1, 2]),
+            "price": np.array([10, 10, 0, 0, 10, 10, 0, 0, 0, 0]),
+        }
+    )
+    index = GroupIndex(df["group"].values)
+    expected = grouped_ema(df, "price", 3, "group")
+    assert np.allclose(expected, grouped_ema(df, "price", 3, index))
+    expected = grouped_lagged_decay(df, "group", "price")
+    assert np.allclose(expected, grouped_lagged_decay(df, index, "price"))
+
+
+def test_grouped_lagged_decays():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {"group": rng.randint(0, 5, size=100), "col": rng.randint(0, 2, size=100)}
+    )
+    decays = [0.1, 1, 3]
+    result = grouped_lagged_decays(df, "group", "col", decays, fillna=-1)
+    assert result.shape == (100, 3)
+    for i, decay in enumerate(decays):
+        f = partial(lagged_decay, decay=decay)
+        expected = group_apply(df["col"].values, df["group"].values, f)
+        assert np.allclose(fillna(expected, -1), result[:, i])
+
+
+def test_grouped_emas():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {"group": rng.randint(0, 5, size=100), "price": rng.normal(size=100)}
+    )
+    n_periods = [1, 3, 8]
+    result = grouped_emas(df, "price", n_periods, "group")
+    assert result.shape == (100, 3)
+    assert result.dtype == np.float32
+    for i, n_period in enumerate(n_periods):
+        expected = df.groupby("group")["price"].transform(
+            partial(ema, n_period=n_period)
+        )
+        assert np.allclose(expected, result[:, i], atol=1e-6)
+
+    result = grouped_emas(df, "price", n_periods, "group", kind="dema", shift=2)
+    for i, n_period in enumerate(n_periods):
+
+        def f(v):
+            return lag(np.asarray(dema(v, n_period)), init=0, shift=2)
+
+        expected = df.groupby("group")["price"].transform(f)
+        assert np.allclose(expected, result[:, i], atol=1e-5)
+
+
+def test_grouped_days_since_result_matches_per_group():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {
+            "runner_id": rng.randint(0, 5, size=100),
+            "score": rng.randint(0, 10, size=100).astype(float),
+            "scheduled_time": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(np.sort(rng.randint(0, 5000, size=100)), unit="h"),
+        }
+    )
+    df.loc[::7, "score"] = np.nan
+    result = grouped_days_since_result(df, "runner_id", col="score", value=5, fillna=-2)
+    expected = group_apply(
+        df[["score", "scheduled_time"]].values,
+        df["runner_id"].values,
+        partial(days_since_result, value=5),
+        multiarg=True,
+    )
+    assert np.allclose(fillna(expected, -2), result)
+
+
+def test_time_since_event_family():
+    df = pd.DataFrame(
+        {
+            "scheduled_time": pd.to_datetime(
+                [
+                    "2024-01-01",
+                    "2024-01-01",
+                    "2024-01-02",
+                    "2024-01-04",
+                    "2024-01-05",
+                    "2024-01-06 12:00",
+                ],
+                format="ISO8601",
+            ),
+            "runner_id": [1, 2, 1, 2, 1, 2],
+        }
+    )
+    result = time_since_first_event(df, "runner_id", "scheduled_time")
+    assert result.dtype == np.float32
+    assert np.allclose(result, [0, 0, 1, 3, 4, 5.5])
+    result = time_since_previous_event(df, "runner_id", "scheduled_time", unit="h")
+    assert nan_allclose(result, [np.nan, np.nan, 24, 72, 72, 60])
+    result = time_until_next_event(df, "runner_id", "scheduled_time", fillna=-1)
+    assert np.allclose(result, [1, 3, 3, 2.5, -1, -1])
+
+
+def test_categorical_to_numeric():
+    values = ["Hello World", " abc ", "Zz", "x", "hello world!!", "Zz"]
+    df = pd.DataFrame({"cat": values})
+
+    def expected_value(text):
+        text = str(text).strip()[:10].lower()
+        return np.log(float("".join(str(ord(char)) for char in text)))
+
+    expected = [expected_value(text) for text in values]
+    assert np.allclose(expected, categorical_to_numeric(df, "cat"))
+    assert categorical_to_numeric(df, ["cat", "cat"]).shape == (6, 2)
+    df = pd.DataFrame({"cat": ["x", None, np.nan, None]})
+    expected = [expected_value(text) for text in df["cat"]]
+    assert np.allclose(expected, categorical_to_numeric(df, "cat"))
+    df = pd.DataFrame({"cat": [1.5, np.nan]})
+    assert np.allclose(expected_value("nan"), categorical_to_numeric(df, "cat")[1])
+
+
+def test_grouped_lagged_rolling_funcs():
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {"group": rng.randint(0, 5, size=120), "col": rng.normal(size=120)}
+    )
+    df.loc[::11, "col"] = np.nan
+    windows = [1, 3, 5]
+    funcs = ["sum", "mean", "median", "max"]
+    result = grouped_lagged_rolling_funcs(df, "group", "col", windows, funcs, shift=2)
+    assert result.shape == (120, 12)
+    assert all(result.dtypes == np.float32)
+    for window in windows:
+        for func in funcs:
+            f = partial(
+                lagged_rolling_func, window=window, func=func, fillna=-1, shift=2
+            )
+            expected = df.groupby("group")["col"].transform(f)
+            name = "col_{}_{}".format(func, window)
+            assert np.allclose(expected, result[name], atol=1e-5)
+
+
+@pytest.mark.parametrize("lagged", [True, False])
+def test_grouped_duration_rolling_funcs(lagged):
+    rng = np.random.RandomState(0)
+    df = pd.DataFrame(
+        {
+            "group": rng.randint(0, 4, size=150),
+            "col": rng.normal(size=150),
+            "time": pd.Timestamp("2024-01-01")
+            + pd.to_timedelta(rng.randint(0, 200, size=150), unit="D"),
+        }
+    )
+    df.loc[::9, "col"] = np.nan
+    funcs = ["sum", "mean", "count", "max"]
+    result = grouped_duration_rolling_funcs(
+        df, "group", "col", "time", ["1D", "30D"], funcs, lagged=lagged, fillna=-1
+    )
+    closed = "left" if lagged else "right"
+    for duration in ["1D", "30D"]:
+        for func in funcs:
+            expected = pd.Series(index=df.index, dtype=float)
+            for _, group in df.sort_values("time", kind="stable").groupby("group"):
+                roll = group.set_index("time")["col"].rolling(duration, closed=closed)
+                expected[group.index] = getattr(roll, func)().values
+            # empty windows count 0, pandas leaves them NaN
+            expected = expected.fillna(0 if func == "count" else -1)
+            name = "col_{}_{}".format(func, duration)
+            assert np.allclose(expected, result[name], atol=1e-5)
@@ -0,0 +1,208 @@
+# pylint: disable=missing-docstring
+import os
+import warnings
+from functools import partial
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from doors import multifeat
+
+
+def double_price(df):
+    return df["price"].values * 2
+
+
+def price_and_size(df):
+    return [df["price"].values + 1, df["size"].values], ["price_plus_one", "size"]
+
+
+def missing_column(df):
+    return df["missing"].values
+
+
+def doubled_plus_size(df):
+    return df["feat:double_price"].values + df["size"].values
+
+
+def sum_of_derived(df):
+    return df["feat:doubled_plus_size"].values + df["feat:price_plus_one"].values
+
+
+@multifeat.declare(inputs=["price"], outputs=["failing"])
+def failing(df):
+    raise ValueError("bad feature")
+
+
+@multifeat.declare(inputs=["price"], outputs=["killed"])
+def killed(df):
+    os._exit(1)
+
+
+def needs_many_rows(df):
+    assert len(df) > 2000
+    return df["feat:double_price"].values + 1
+
+
+def plus_needs_many_rows(df):
+    return df["feat:needs_many_rows"].values * 2
+
+
+@pytest.mark.parametrize("backend", ["process", "thread", "auto"])
+def test_parallel_matches_serial(df, backend):
+    features = [double_price, price_and_size]
+    serial = multifeat.generate_features(df, features, [], n_jobs=1)
+    parallel = multifeat.generate_features(df, features, [], 2, backend=backend)
+    assert list(parallel.columns) == list(serial.columns)
+    assert (parallel.dtypes == np.float32).all()
+    assert parallel.values.flags.f_contiguous
+    pd.testing.assert_frame_equal(parallel, serial)
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_missing_columns_fail_fast(df, n_jobs):
+    with pytest.raises(KeyError, match="missing"):
+        multifeat.generate_features(df, [double_price, missing_column], [], n_jobs)
+
+
+def test_parallel_reports_failed_features(df):
+    with pytest.raises(RuntimeError, match="bad feature"):
+        multifeat.generate_features(df, [double_price, failing], [], n_jobs=2)
+
+
+def test_parallel_raises_when_a_worker_dies(df):
+    has_shm_dir = os.path.isdir("/dev/shm")
+    shared_blocks = set(os.listdir("/dev/shm")) if has_shm_dir else set()
+    with pytest.raises(RuntimeError, match="exit code 1"):
+        multifeat.generate_features(df, [double_price, killed], [], n_jobs=2)
+    if has_shm_dir:
+        assert set(os.listdir("/dev/shm")) <= shared_blocks
+
+
+@pytest.mark.parametrize(
+    "n_jobs, backend", [(1, "process"), (2, "process"), (2, "thread"), (2, "auto")]
+)
+def test_features_depending_on_features(df, n_jobs, backend):
+    in_process = multifeat.declare(backend="process")
+    features = [
+        in_process(partial(sum_of_derived)),
+        doubled_plus_size,
+        in_process(partial(price_and_size)),
+        double_price,
+    ]
+    feat_df = multifeat.generate_features(df, features, [], n_jobs, backend=backend)
+    assert list(feat_df.columns) == [
+        "feat:partial(func=sum_of_derived)",
+        "feat:doubled_plus_size",
+        "feat:price_plus_one",
+        "feat:size",
+        "feat:double_price",
+    ]
+    expected = (df["price"] * 2).astype("float32") + df["size"] + df["price"] + 1
+    np.testing.assert_allclose(feat_df.iloc[:, 0], expected, rtol=1e-6)
+
+
+def test_serial_writes_into_one_block(df):
+    features = [partial(double_price)] * 150 + [price_and_size]
+    df.index = df.index + 10
+
+    def helper(df):
+        return df["price"].values * 3
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", pd.errors.PerformanceWarning)
+        feat_df = multifeat.generate_features(df, features, [helper], n_jobs=1)
+    assert feat_df.shape == (len(df), 153)
+    assert feat_df.columns[-3:].tolist() == [
+        "feat:price_plus_one",
+        "feat:size",
+        "helper",
+    ]
+    assert np.array_equal(feat_df.index, df.index)
+    np.testing.assert_allclose(feat_df["helper"], df["price"] * 3)
+    np.testing.assert_allclose(feat_df["feat:size"], df["size"])
+
+
+def test_feature_block_grows():
+    block = multifeat._FeatureBlock(3, 1)
+    for i in range(5):
+        block.append(str(i), np.full(3, i))
+    assert block.values.shape == (3, 8)
+    frame = block.to_frame(pd.RangeIndex(3))
+    assert frame.columns.tolist() == ["0", "1", "2", "3", "4"]
+    assert np.shares_memory(frame.values, block.values)
+    reordered = block.to_frame(pd.RangeIndex(3), order=[4, 0])
+    assert reordered.iloc[0].tolist() == [4, 0]
+
+
+def test_unknown_backend(df):
+    with pytest.raises(ValueError):
+        multifeat.generate_features(df, [double_price], [], 2, backend="gpu")
+    with pytest.raises(ValueError):
+        multifeat.declare(backend="gpu")
+
+
+def test_schedule_levels(df):
+    generator = multifeat.SerialFeatureGenerator()
+    features = [sum_of_derived, doubled_plus_size, price_and_size, double_price]
+    levels, inputs = generator._schedule(df, features)
+    assert levels == [[2, 3], [1], [0]]
+    assert inputs[1] == ["feat:double_price", "size"]
+
+
+def test_schedule_with_declared_columns(df):
+    generator = multifeat.SerialFeatureGenerator()
+    first = multifeat.declare(["price"], ["first"])(partial(double_price))
+    second = multifeat.declare(["feat:first"], ["second"])(partial(missing_column))
+    levels, _ = generator._schedule(df, [second, first])
+    assert levels == [[1], [0]]
+
+
+def test_schedule_detects_cycles(df):
+    generator = multifeat.SerialFeatureGenerator()
+    first = multifeat.declare(inputs=["feat:b"], outputs=["a"])(lambda df: None)
+    second = multifeat.declare(inputs=["feat:a"], outputs=["b"])(lambda df: None)
+    with pytest.raises(ValueError, match="cycle"):
+        generator._schedule(df, [first, second])
+
+
+def test_shared_frame(df):
+    frame = multifeat.SharedFrame(df)
+    try:
+        attached = frame.attach()
+        pd.testing.assert_frame_equal(attached, df)
+        assert not attached["price"].values.flags.writeable
+        del attached
+    finally:
+        frame.unlink()
+
+
+@pytest.mark.parametrize("n_jobs", [1, 2])
+def test_failing_dry_runs_run_last(df, n_jobs):
+    df = pd.concat([df] * 30, ignore_index=True)
+    features = [plus_needs_many_rows, needs_many_rows, double_price]
+    generator = multifeat.SerialFeatureGenerator()
+    levels, inputs = generator._schedule(df, features)
+    assert levels == [[2], [1], [0]]
+    assert "feat:double_price" in inputs[1]
+    feat_df = multifeat.generate_features(df, features, [], n_jobs, "thread")
+    expected = (df["price"] * 2).astype("float32") + 1
+    np.testing.assert_allclose(feat_df["feat:plus_needs_many_rows"], 2 * expected)
+
+
+def test_small_frames_run_features_once(df):
+    calls = []
+
+    def counted(df):
+        calls.append(None)
+        return df["price"].values * 2
+
+    first = multifeat.generate_features(df, [counted], [], n_jobs=1)
+    assert len(calls) == 1
+    df = pd.concat([df] * 11, ignore_index=True)
+    second = multifeat.generate_features(df, [counted], [], n_jobs=2, backend="thread")
+    assert len(calls) == 3
+    np.testing.assert_array_equal(
+        second["feat:counted"][: len(first)], first.iloc[:, 0]
+    )
@@ -196,3 +196,224 @@ def test_cross_entropy_with_unnormalised_predictions():
     flags = np.array([[0.0, 1.0, 0.0], [1.0, 0.0, 0.0]])
     with pytest.raises(AssertionError):
         utils_np.x_ent(flags, predictions)
+
+
+def test_group_index():
+    ids = np.array(["b", "a", "b", "c", "a", "b"])
+    index = utils_np.GroupIndex(ids)
+    assert index.n_groups == 3
+    assert len(index) == 6
+    assert np.array_equal(index.sizes, [3, 2, 1])
+    assert np.array_equal(index.keys, ["b", "a", "c"])
+    assert np.array_equal(index.unsort(index.sort(ids)), ids)
+    ixs = index.ixs()
+    assert np.array_equal(ixs["b"], [0, 2, 5])
+    assert np.array_equal(ixs["a"], [1, 4])
+
+
+def test_group_index_null_keys_are_groups_of_their_own():
+    values = np.array([1.0, 10, 2, 20, 30])
+    index = utils_np.GroupIndex(np.array([1, np.nan, 1, np.nan, np.nan]))
+    assert index.n_groups == 4
+    assert np.array_equal(index.null_keys, [False, True, False, True, True])
+    result = utils_np.group_apply(values, index, "cumsum")
+    assert np.array_equal(result, [1, 10, 3, 20, 30])
+    index = utils_np.GroupIndex(np.array([1, 1, 1]), np.array(["a", None, None]))
+    assert np.array_equal(index.codes, [0, 1, 2])
+    assert np.array_equal(index.sorted_view().null_keys, [False, True, True])
+
+
+def test_group_index_is_reusable():
+    values = np.array([1, 0, 0, 1, 1, 0])
+    index = utils_np.GroupIndex(np.array([1, 2, 1, 2, 1, 2]))
+    expected = np.array([1, 0, 1, 1, 2, 1])
+    assert np.all(utils_np.group_apply(values, index, np.cumsum) == expected)
+    assert np.all(utils_np.simple_group_apply(values, index, np.cumsum) == expected)
+    ixs = utils_np.get_group_ixs(index)
+    assert np.array_equal(ixs[1], [0, 2, 4])
+
+
+def test_group_index_sorted_view():
+    ids = np.array(["b", "a", "b", "c", "a", "b"])
+    values = np.arange(6.0)
+    index = utils_np.GroupIndex(ids)
+    view = index.sorted_view()
+    svalues = index.sort(values)
+    assert view.sort(svalues) is svalues
+    assert np.array_equal(view.keys, index.keys)
+    cumsums = utils_np.group_lagged_cumsum(svalues, view, 0)
+    expected = utils_np.group_lagged_cumsum(values, index, 0)
+    assert np.array_equal(index.unsort(cumsums), expected)
+
+
+def test_group_index_with_several_ids():
+    index = utils_np.GroupIndex(np.array([1, 1, 2, 2]), np.array(["a", "b", "b", "b"]))
+    assert index.n_groups == 3
+    assert index.keys == [(1, "a"), (1, "b"), (2, "b")]
+
+
+@pytest.mark.parametrize(
+    "name, func",
+    [
+        ("sum", np.sum),
+        ("mean", np.mean),
+        ("min", np.min),
+        ("max", np.max),
+        ("count", len),
+        ("std", np.std),
+        ("first", lambda v: v[0]),
+        ("last", lambda v: v[-1]),
+        ("cumsum", np.cumsum),
+        ("cumcount", lambda v: np.arange(len(v))),
+    ],
+)
+@pytest.mark.parametrize("special", [None, np.nan, np.inf, 1e16])
+def test_named_group_apply_matches_callables(name, func, special):
+    rng = np.random.RandomState(0)
+    values = rng.normal(size=50)
+    ids = rng.randint(0, 7, size=50)
+    if special is not None:
+        values[ids == 3] = special
+    expected = utils_np.group_apply(values, ids, func)
+    result = utils_np.group_apply(values, ids, name)
+    assert np.allclose(expected, result, equal_nan=True)
+
+
+def test_named_group_apply_works_with_matrices():
+    values = np.arange(12.0).reshape(6, 2)
+    ids = np.array([1, 2, 1, 2, 1, 2])
+    expected = utils_np.group_apply(values, ids, lambda v: np.cumsum(v, axis=0))
+    assert np.allclose(expected, utils_np.group_apply(values, ids, "cumsum"))
+    result = utils_np.group_apply(values, ids, "count")
+    assert np.allclose(result, 3)
+
+
+def test_named_group_apply_raises_with_unknown_name():
+    with pytest.raises(ValueError):
+        utils_np.group_apply(np.arange(3), np.arange(3), "median")
+
+
+def test_vector_group_apply_with_strkeys():
+    values = np.array([1, 1, 1, 2, 2, 2])
+    ids = np.array([[1, 0], [1, 0], [1, 0], [1, 1], [2, 2], [2, 2]])
+    expected = np.array([3, 3, 3, 2, 4, 4])
+    output = utils_np.group_apply(values, ids, np.sum, strkeys=True)
+    assert np.all(output == expected)
+
+
+def test_multi_key_codes_do_not_collide_like_strings():
+    index = utils_np.GroupIndex(np.array(["a_b", "a"]), np.array(["c", "b_c"]))
+    assert index.n_groups == 2
+
+
+def test_lexsort_codes_matches_combined_codes():
+    rng = np.random.RandomState(0)
+    codes = [rng.randint(0, 4, size=100), rng.randint(0, 3, size=100)]
+    combined = utils_np._combine_codes(codes)
+    lexsorted = utils_np._lexsort_codes(codes)
+    for code in np.unique(combined):
+        assert len(np.unique(lexsorted[combined == code])) == 1
+    assert len(np.unique(combined)) == len(np.unique(lexsorted))
+
+
+def test_get_group_ixs_compact():
+    ids = np.array(["b", "a", "b", "c", "a", "b"])
+    expected = utils_np.get_group_ixs(ids)
+    result = utils_np.get_group_ixs(ids, compact=True)
+    assert len(result) == 3
+    assert np.array_equal(result.offsets, [0, 3, 5, 6])
+    assert set(result) == set(expected)
+    for key, ix in expected.items():
+        assert np.array_equal(result[key], ix)
+
+
+def test_get_group_ixs_bools():
+    ids = np.array([1, 2, 1, 3])
+    result = utils_np.get_group_ixs(ids, bools=True)
+    assert np.array_equal(result[1], [True, False, True, False])
+    assert np.array_equal(result[3], [False, False, False, True])
+
+
+@pytest.mark.parametrize("backend", ["thread", "process"])
+def test_parallel_group_apply(backend):
+    rng = np.random.RandomState(0)
+    values = rng.normal(size=200)
+    ids = rng.randint(0, 20, size=200)
+    expected = utils_np.group_apply(values, ids, np.cumsum)
+    result = utils_np.group_apply(values, ids, np.cumsum, n_jobs=3, backend=backend)
+    assert np.allclose(expected, result)
+
+
+def test_chunk_offsets_cover_all_groups():
+    offsets = np.array([0, 10, 11, 12, 40, 41, 100])
+    chunks = utils_np._chunk_offsets(offsets, 3)
+    assert chunks[0][0] == 0
+    assert chunks[-1][-1] == 100
+    for previous, chunk in zip(chunks[:-1], chunks[1:]):
+        assert previous[-1] == chunk[0]
+
+
+def test_moving_median():
+    array = np.array([1.0, 9, 2, 8, 3, np.nan, 4])
+    for center in [False, True]:
+        expected = pd.Series(array).rolling(3, center=center, min_periods=1).median()
+        result = utils_np.moving_median(array, 3, center=center)
+        assert np.allclose(expected, result, equal_nan=True)
+
+
+def test_ffill_and_bfill_on_matrices():
+    values = np.array([[np.nan, 1], [2, np.nan], [np.nan, np.nan], [3, 4]])
+    expected = np.array([[np.nan, 1], [2, 1], [2, 1], [3, 4]])
+    assert utils_np.nan_allclose(utils_np.ffill(values), expected)
+    expected = np.array([[2, 1], [2, 4], [3, 4], [3, 4]])
+    assert utils_np.nan_allclose(utils_np.bfill(values), expected)
+
+
+def test_grouped_ffill_with_limit():
+    values = np.array([1, np.nan, 2, np.nan, np.nan, np.nan, np.nan])
+    ids = np.array([1, 2, 2, 1, 1, 2, 1])
+    expected = np.array([1, np.nan, 2, 1, 1, 2, np.nan])
+    result = utils_np.ffill(values, group_ids=ids, limit=2)
+    assert utils_np.nan_allclose(result, expected)
+    expected = np.array([1, 2, 2, np.nan, np.nan, np.nan, np.nan])
+    assert utils_np.nan_allclose(utils_np.bfill(values, group_ids=ids), expected)
+
+
+def test_ffill_datetimes_into_buffer():
+    dates = np.array(["2020-01-01", "NaT", "2020-01-03", "NaT"], dtype="datetime64[D]")
+    out = np.empty_like(dates)
+    result = utils_np.ffill(dates, out=out)
+    assert result is out
+    expected = np.array(["2020-01-01", "2020-01-01", "2020-01-03", "2020-01-03"])
+    assert np.array_equal(out, expected.astype("datetime64[D]"))
+
+
+def test_group_lag_and_lead():
+    values = np.array([1, 10, 2, 20, 3, 30])
+    ids = np.array([1, 2, 1, 2, 1, 2])
+    expected = utils_np.group_apply(values, ids, lambda v: utils_np.lag(v, -1))
+    assert np.array_equal(utils_np.group_lag(values, ids, -1), expected)
+    expected = np.array([99, 99, 99, 99, 1, 10])
+    assert np.array_equal(utils_np.group_lag(values, ids, 99, shift=2), expected)
+    expected = np.array([2, 20, 3, 30, 0, 0])
+    assert np.array_equal(utils_np.group_lead(values, ids, 0), expected)
+    assert np.all(utils_np.group_lag(values, ids, 0, shift=5) == 0)
+
+
+def test_group_lagged_cumsum_and_cumcount():
+    values = np.array([1, 10, 2, 20, 3, 30])
+    ids = np.array([1, 2, 1, 2, 1, 2])
+    expected = utils_np.group_apply(values, ids, lambda v: utils_np.lagged_cumsum(v, 0))
+    assert np.array_equal(utils_np.group_lagged_cumsum(values, ids, 0), expected)
+    expected = np.array([0, 0, 1, 1, 2, 2])
+    assert np.array_equal(utils_np.group_lagged_cumcount(ids, 0), expected)
+
+
+def test_group_lagged_cumsum_keeps_nulls_in_their_group():
+    values = np.array([np.nan, 1, 2, 3, 1e16, 1, 4, 5])
+    ids = np.array([0, 0, 1, 1, 2, 2, 3, 3])
+    expected = np.array([0, np.nan, 0, 2, 0, 1e16, 0, 4])
+    result = utils_np.group_lagged_cumsum(values, ids, 0)
+    assert np.array_equal(result, expected, equal_nan=True)
+    counts = utils_np.group_lagged_cumcount(ids, 0)
+    assert np.array_equal(counts, [0, 1, 0, 1, 0, 1, 0, 1])
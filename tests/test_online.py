@@ -0,0 +1,63 @@
+# pylint: disable=missing-docstring
+import numpy as np
+import pandas as pd
+import pytest
+
+from doors import features, online
+
+
+@pytest.fixture
+def df(df):
+    """The shared df with infs, and NaT dates on winning rows, past the history"""
+    df = df.copy()
+    df.loc[[155, 171, 180], "win_flag"] = [np.inf, -np.inf, np.inf]
+    df.loc[[152, 165, 175, 185], "win_flag"] = 2
+    df.loc[[152, 165, 175, 185], "scheduled_time"] = pd.NaT
+    return df
+
+
+def check_online_matches_batch(updater, df, expected, tmp_path):
+    split = 150
+    updater.fit(df.iloc[:split])
+    path = str(tmp_path / "state.pkl")
+    updater.save(path)
+    updater = online.OnlineFeature.load(path)
+    result = np.r_[updater.update(df.iloc[split:170]), updater.update(df.iloc[170:])]
+    assert np.allclose(np.asarray(expected)[split:], result, equal_nan=True)
+
+
+def test_online_ema(df, tmp_path):
+    df = df.fillna(0)
+    expected = features.grouped_lagged_ema(df, "win_flag", 3, "group", 2, -1)
+    updater = online.OnlineEMA("win_flag", 3, "group", shift=2, init=-1)
+    check_online_matches_batch(updater, df, expected, tmp_path)
+    expected = features.grouped_ema(df, "win_flag", 3, "group")
+    updater = online.OnlineEMA("win_flag", 3, "group")
+    check_online_matches_batch(updater, df, expected, tmp_path)
+
+
+def test_online_lagged_decay(df, tmp_path):
+    expected = features.grouped_lagged_decay(df, "group", "win_flag", decay=0.5)
+    updater = online.OnlineLaggedDecay("win_flag", "group", decay=0.5)
+    check_online_matches_batch(updater, df, expected, tmp_path)
+
+
+@pytest.mark.parametrize("func", ["sum", "mean"])
+def test_online_rolling(df, tmp_path, func):
+    expected = features.grouped_lagged_rolling_func(
+        df, "group", "win_flag", window=3, func=func, fillna=-1, shift=2
+    )
+    updater = online.OnlineRolling("win_flag", "group", 3, func=func, shift=2)
+    check_online_matches_batch(updater, df, expected, tmp_path)
+
+
+def test_online_days_since_result(df, tmp_path):
+    expected = features.grouped_days_since_result(df, "group")
+    updater = online.OnlineDaysSinceResult("group")
+    check_online_matches_batch(updater, df, expected, tmp_path)
+
+
+def test_online_days_to_first_event(df, tmp_path):
+    expected = features.days_to_first_event(df, "group", "scheduled_time")
+    updater = online.OnlineDaysToFirstEvent("group", "scheduled_time")
+    check_online_matches_batch(updater, df, expected, tmp_path)
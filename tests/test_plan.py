@@ -0,0 +1,76 @@
+# pylint: disable=missing-docstring
+import numpy as np
+import pytest
+
+from doors import features, multifeat, np as wnp
+from doors.plan import FeaturePlan, FeatureSpec
+
+
+def test_plan_matches_features(df):
+    specs = [
+        FeatureSpec("ema", "price", "group", {"n_period": 5}),
+        FeatureSpec("rolling", "price", "other", {"window": 3, "func": "max"}),
+        FeatureSpec("ema", "price", "group", {"n_period": 20, "shift": 1}),
+        FeatureSpec("ema", "price", "group", {"n_period": 3}),
+        FeatureSpec("lagged_decay", "win_flag", "other", {"decay": 0.5}),
+        FeatureSpec("rolling", "price", "other", {"window": 4, "func": "mean"}),
+        FeatureSpec("days_since_result", "win_flag", "group"),
+        FeatureSpec("time_since_first_event", "scheduled_time", "other"),
+        FeatureSpec("lag", "price", "group", {"shift": 2}),
+    ]
+    plan = FeaturePlan(specs)
+    result = plan.execute(df)
+    assert list(result.columns) == [spec.name for spec in specs]
+    assert list(plan.steps) == ["group", "other"]
+    expected = [
+        features.grouped_ema(df, "price", 5, "group"),
+        features.grouped_lagged_rolling_func(df, "other", "price", 3, "max", -1, 1),
+        features.grouped_lagged_ema(df, "price", 20, "group"),
+        features.grouped_ema(df, "price", 3, "group"),
+        features.grouped_lagged_decay(df, "other", "win_flag", decay=0.5),
+        features.grouped_lagged_rolling_func(df, "other", "price", 4, "mean", -1, 1),
+        features.grouped_days_since_result(df, "group"),
+        features.time_since_first_event(df, "other", "scheduled_time"),
+        wnp.group_lag(df["price"].values, df["group"].values, np.nan, shift=2),
+    ]
+    for name, values in zip(result.columns, expected):
+        np.testing.assert_allclose(
+            result[name].values, np.asarray(values, dtype=np.float32), rtol=1e-6
+        )
+
+
+def test_plan_batches_specs():
+    specs = [
+        FeatureSpec("ema", "price", "group", {"n_period": 5}),
+        FeatureSpec("ema", "price", "group", {"n_period": 10}),
+        FeatureSpec("ema", "price", "group", {"n_period": 5, "shift": 1}),
+        FeatureSpec("days_since_result", "win_flag", "group", {"coldate": "t"}),
+    ]
+    plan = FeaturePlan(specs)
+    assert list(plan.steps["group"].values()) == [[0, 1], [2], [3]]
+    assert plan.input_columns() == ["group", "price", "win_flag", "t"]
+
+
+def test_plan_rejects_bad_specs():
+    with pytest.raises(ValueError):
+        FeaturePlan([FeatureSpec("nope", "price", "group")])
+    with pytest.raises(ValueError):
+        FeaturePlan([FeatureSpec("ema", "price", "group")])
+
+
+def test_generate_features_with_specs(df):
+    specs = [
+        FeatureSpec("ema", "price", "group", {"n_period": 5}),
+        FeatureSpec("lagged_decay", "win_flag", "other", {"decay": 1}),
+    ]
+
+    def double_price(df):
+        return df["price"].values * 2
+
+    feat_df = multifeat.generate_features(df, specs + [double_price], [], n_jobs=1)
+    expected = FeaturePlan(specs).execute(df)
+    for spec in specs:
+        np.testing.assert_array_equal(
+            feat_df["feat:" + spec.name].values, expected[spec.name].values
+        )
+    assert feat_df.shape[1] == 3
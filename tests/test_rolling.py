@@ -0,0 +1,103 @@
+# pylint: disable=missing-docstring
+import numpy as np
+import pandas as pd
+import pytest
+
+from doors import backends, rolling
+
+v = np.array([1.0, 3, np.nan, 2, 8, -1, 4, np.nan, np.nan, 5, 6, 0])
+
+
+@pytest.fixture(params=backends.available_backends())
+def backend(request):
+    previous = backends.get_backend()
+    backends.set_backend(request.param)
+    yield request.param
+    backends.set_backend(previous)
+
+
+@pytest.mark.parametrize("window", [1, 3, 5, 20])
+@pytest.mark.parametrize("min_periods", [1, 2])
+def test_rolling_matches_pandas(backend, window, min_periods):
+    min_periods = min(min_periods, window)
+    roll = pd.Series(v).rolling(window, min_periods=min_periods)
+    tests = [
+        (rolling.rolling_sum, roll.sum()),
+        (rolling.rolling_mean, roll.mean()),
+        (rolling.rolling_max, roll.max()),
+        (rolling.rolling_min, roll.min()),
+    ]
+    for func, expected in tests:
+        result = func(v, window, min_periods=min_periods)
+        assert np.allclose(expected, result, equal_nan=True)
+    result = rolling.rolling_std(v, window, min_periods=min_periods, ddof=1)
+    assert np.allclose(roll.std(), result, equal_nan=True)
+
+
+def test_rolling_var_is_stable_on_long_series(backend):
+    rng = np.random.RandomState(0)
+    values = 1e8 + rng.normal(size=100000)
+    result = rolling.rolling_var(values, 50)
+    expected = np.var(values[-50:])
+    assert np.isclose(result[-1], expected, rtol=1e-4)
+
+
+def test_windows_longer_than_the_series(backend):
+    values = np.arange(5.0)
+    expected = pd.Series(values).expanding()
+    assert np.allclose(rolling.rolling_mean(values, 10**11), expected.mean())
+    assert np.allclose(rolling.rolling_max(values, 10**11), expected.max())
+    assert np.allclose(rolling.rolling_median(values, 10**11), expected.median())
+
+
+def test_infinite_values_stay_in_their_windows(backend):
+    values = np.array([1.0, np.inf, 1, 1, 1, 1, 1])
+    result = rolling.rolling_sum(values, 3)
+    assert np.array_equal(result, [1, np.inf, np.inf, np.inf, 3, 3, 3])
+    result = rolling.rolling_max(-values, 3)
+    assert np.array_equal(result, [-1, -1, -1, -1, -1, -1, -1])
+    result = rolling.rolling_max([-np.inf, 1, -np.inf, -np.inf], 2)
+    assert np.array_equal(result, [-np.inf, 1, 1, -np.inf])
+    values = np.array([1.0, 2, np.inf, 3, 4, 5, 6, 7])
+    result = rolling.rolling_std(values, 2)
+    expected = [0, 0.5, np.nan, np.nan, 0.5, 0.5, 0.5, 0.5]
+    assert np.allclose(result, expected, equal_nan=True)
+
+
+def test_rolling_std_after_a_change_of_scale(backend):
+    rng = np.random.RandomState(0)
+    values = np.r_[1e6 * rng.normal(size=500), 1e-3 * rng.normal(size=500)]
+    result = rolling.rolling_std(values, 20, ddof=1)
+    expected = pd.Series(values).rolling(20, min_periods=2)
+    expected = expected.apply(lambda x: np.std(x, ddof=1), raw=True)
+    assert np.allclose(result, expected, rtol=1e-8, equal_nan=True)
+
+
+def test_rolling_sharpe():
+    values = np.array([1.0, 2, 3, 4])
+    expected = np.mean(values[1:]) / np.std(values[1:])
+    assert np.isclose(rolling.rolling_sharpe(values, 3)[-1], expected)
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 4, 20])
+def test_rolling_quantiles_match_pandas(backend, window):
+    roll = pd.Series(v).rolling(window, min_periods=1)
+    assert np.allclose(roll.median(), rolling.rolling_median(v, window), equal_nan=True)
+    result = rolling.rolling_quantile(v, window, 0.3)
+    assert np.allclose(roll.quantile(0.3), result, equal_nan=True)
+    roll = pd.Series(v).rolling(window, min_periods=1, center=True)
+    result = rolling.centered(rolling.rolling_median, v, window)
+    assert np.allclose(roll.median(), result, equal_nan=True)
+
+
+def test_streaming_rolling_quantile():
+    median = rolling.RollingQuantile(window=3, q=0.5)
+    assert [median.update(x) for x in [1, 5, 2, 8]] == [1.0, 3.0, 2.0, 5.0]
+    assert np.allclose(median.update_many([np.nan, 0]), [5.0, 4.0])
+
+
+@pytest.mark.parametrize("window", [1, 3, 20])
+def test_streaming_rolling_quantile_matches_batch(backend, window):
+    result = rolling.RollingQuantile(window, q=0.3).update_many(v)
+    expected = rolling.rolling_quantile(v, window, 0.3)
+    assert np.allclose(result, expected, equal_nan=True)